@@ -1,31 +1,525 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Header
+from fastapi import FastAPI, APIRouter, HTTPException, Header, Query, Request, Response
+import numpy as np
+import pandas as pd
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError
 import os
 import logging
 import httpx
 import asyncio
+import random
+import json
+import re
+import gzip
+import hashlib
+import base64
+import heapq
+import itertools
+import bisect
+import threading
+import time
+import contextvars
+from email.utils import parsedate_to_datetime
+import tempfile
+import fcntl
+from collections import OrderedDict
 from pathlib import Path
+from contextlib import asynccontextmanager, nullcontext
 from pydantic import BaseModel
 from typing import List, Optional
 import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+
+# --- Metrics ---
+# Counters and histograms keyed by a tuple of label values, rendered as
+# Prometheus text on /api/metrics. An observation is a dict lookup and a
+# bisect; the lock is there because pymongo calls the Mongo listener from
+# Motor's worker threads.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape_label(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def render_samples(name, kind, help, label_names, samples):
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for values, value in samples:
+        lines.append(f"{name}{_label_text(label_names, values)} {value}")
+    return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        return render_samples(self.name, "counter", self.help, self.labels, sorted(self.values.items()))
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> per-bucket counts (last slot is +Inf) followed by the sum
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        slot = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[slot] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_label_text(names, labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, labels)} {cumulative}")
+        return lines
+
+
+http_request_seconds = Histogram("http_request_duration_seconds", "Time until response headers are sent.", ("method", "route", "status"))
+cache_served = Counter("cache_served_total", "cached_fetch answers by source.", ("key", "result"))
+upstream_request_seconds = Histogram("upstream_request_duration_seconds", "CoinGecko call latency, hedges included.", ("endpoint",))
+upstream_responses = Counter("upstream_responses_total", "CoinGecko call outcomes.", ("endpoint", "status"))
+mongo_command_seconds = Histogram("mongo_command_duration_seconds", "MongoDB command latency.", ("command", "collection"))
+mongo_command_failures = Counter("mongo_command_failures_total", "Failed MongoDB commands.", ("command", "collection"))
+event_loop_lag_seconds = Histogram("event_loop_lag_seconds", "Event loop scheduling delay.")
+METRICS = [http_request_seconds, cache_served, upstream_request_seconds, upstream_responses,
+           mongo_command_seconds, mongo_command_failures, event_loop_lag_seconds]
+
+
+# --- Request profiling ---
+# A profiled request carries a RequestProfile in a context variable; code on
+# its path records spans with profile_phase(kind, detail). Tasks started
+# from the request and Motor's executor calls inherit the context, so
+# upstream fetches and Mongo commands land in the same profile. Unprofiled
+# requests see None and get a shared no-op context manager.
+_request_profile = contextvars.ContextVar("request_profile", default=None)
+_NO_PHASE = nullcontext()
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def add(self, name, start, end):
+        self.spans.append((name, start - self.started, end - start))
+
+    def breakdown(self):
+        phases = {}
+        for name, _, duration in list(self.spans):
+            phase = phases.setdefault(name, [0.0, 0])
+            phase[0] += duration
+            phase[1] += 1
+        return sorted(phases.items(), key=lambda item: -item[1][0])
+
+
+class _Phase:
+    __slots__ = ("profile", "name", "start")
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profile.add(self.name, self.start, time.perf_counter())
+
+
+def profile_phase(kind, detail=None):
+    profile = _request_profile.get()
+    if profile is None:
+        return _NO_PHASE
+    return _Phase(profile, kind if detail is None else f"{kind}:{detail}")
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    def __init__(self):
+        self.collections = {}
+
+    def _collection(self, event):
+        return self.collections.pop((event.connection_id, event.request_id), "")
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        self.collections[(event.connection_id, event.request_id)] = target if isinstance(target, str) else ""
+
+    def _observe(self, event, collection):
+        seconds = event.duration_micros / 1e6
+        mongo_command_seconds.observe(seconds, event.command_name, collection)
+        profile = _request_profile.get()
+        if profile is not None:
+            end = time.perf_counter()
+            profile.add(f"mongo:{event.command_name}", end - seconds, end)
+
+    def succeeded(self, event):
+        self._observe(event, self._collection(event))
+
+    def failed(self, event):
+        collection = self._collection(event)
+        self._observe(event, collection)
+        mongo_command_failures.inc(event.command_name, collection)
+
+
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandTimer()])
 db = client[os.environ['DB_NAME']]
 
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'Newral@123')
 
-app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
-_cache = {}
-COINGECKO_BASE = "https://api.coingecko.com/api/v3"
+_inflight = {}
+_inflight_throttled = {}
+_cache_listeners = []
+COINGECKO_BASE = os.environ.get('COINGECKO_BASE', "https://api.coingecko.com/api/v3")
+COINGECKO_PAGE_SIZE = 250
+TOP_COINS_MAX = int(os.environ.get('TOP_COINS_MAX', '100'))
+
+# One pooled client is shared by every upstream call so DNS, TCP and TLS
+# setup to CoinGecko is paid once per connection rather than once per miss.
+UPSTREAM_MAX_CONNECTIONS = int(os.environ.get('UPSTREAM_MAX_CONNECTIONS', '20'))
+UPSTREAM_MAX_KEEPALIVE = int(os.environ.get('UPSTREAM_MAX_KEEPALIVE', '10'))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.environ.get('UPSTREAM_KEEPALIVE_EXPIRY', '60'))
+UPSTREAM_HTTP2 = os.environ.get('UPSTREAM_HTTP2', 'true').lower() in ('1', 'true', 'yes')
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', '5'))
+UPSTREAM_TIMEOUT = float(os.environ.get('UPSTREAM_TIMEOUT', '15'))
+UPSTREAM_TIMEOUTS = {
+    "top_coins": float(os.environ.get('UPSTREAM_TIMEOUT_TOP_COINS', UPSTREAM_TIMEOUT)),
+    "trending": float(os.environ.get('UPSTREAM_TIMEOUT_TRENDING', UPSTREAM_TIMEOUT)),
+    "global": float(os.environ.get('UPSTREAM_TIMEOUT_GLOBAL', UPSTREAM_TIMEOUT)),
+}
+http_client = None
+
+
+def _latency_slo(name, budget, hedge_after):
+    # budget: how long a request waits on CoinGecko before it is answered from
+    # cache or fallback. hedge_after: when a second request for the same URL
+    # is sent if the first has not answered.
+    prefix = f"LATENCY_{name.upper()}"
+    return name, {
+        "budget": float(os.environ.get(f"{prefix}_BUDGET", budget)),
+        "hedge_after": float(os.environ.get(f"{prefix}_HEDGE_AFTER", hedge_after)),
+    }
+
+
+LATENCY_SLOS = dict([
+    _latency_slo("top_coins", 0.3, 0.2),
+    _latency_slo("trending", 0.3, 0.2),
+    _latency_slo("global", 0.3, 0.2),
+    _latency_slo("exchange_rates", 0.3, 0.2),
+    _latency_slo("price", 0.3, 0.2),
+])
+
+
+def _refresh_policy(name, interval, jitter, max_stale):
+    prefix = f"REFRESH_{name.upper()}_"
+    return {
+        "interval": float(os.environ.get(prefix + "INTERVAL", interval)),
+        "jitter": float(os.environ.get(prefix + "JITTER", jitter)),
+        "max_stale": float(os.environ.get(prefix + "MAX_STALE", max_stale)),
+    }
+
+# Market keys are refreshed in the background shortly before their TTL runs
+# out, so requests are answered from memory. A request only waits on upstream
+# once the cached payload is older than max_stale.
+REFRESH_POLICIES = {
+    "top_coins": _refresh_policy("top_coins", 105, 10, 900),
+    "trending": _refresh_policy("trending", 280, 15, 1800),
+    "global": _refresh_policy("global", 280, 15, 1800),
+    "exchange_rates": _refresh_policy("exchange_rates", 570, 30, 21600),
+}
+REFRESH_TICK = 1.0
+REFRESH_RETRY_SECONDS = 30.0
+_refresh_targets = {}
+_refresher_task = None
+
+
+# LRU cache with per-namespace entry limits, a total byte budget and a hard
+# per-namespace expiry. Namespaces are matched by key prefix, so
+# "top_coins_20" belongs to "top_coins". Each namespace keeps its own LRU
+# order next to the global one, so enforcing its limit on set is O(1).
+class BoundedCache:
+    def __init__(self, max_bytes, namespaces, default_limit=64, default_max_age=3600):
+        self.max_bytes = max_bytes
+        self.namespaces = namespaces
+        self.default = {"max_entries": default_limit, "max_age": default_max_age}
+        self.entries = OrderedDict()
+        self.lru = {}
+        self.bytes = 0
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def namespace(self, key):
+        matches = [ns for ns in self.namespaces if key.startswith(ns)]
+        return max(matches, key=len) if matches else "default"
+
+    def _limits(self, ns):
+        return self.namespaces.get(ns, self.default)
+
+    def _drop(self, key):
+        entry = self.entries.pop(key)
+        del self.lru[entry["ns"]][key]
+        self.bytes -= entry["size"]
+
+    def max_age(self, key):
+        return self._limits(self.namespace(key))["max_age"]
+
+    def _expired(self, entry, now):
+        return now - entry["ts"] > self._limits(entry["ns"])["max_age"]
+
+    def peek(self, key):
+        return self.entries.get(key)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None and self._expired(entry, datetime.now(timezone.utc).timestamp()):
+            self._drop(key)
+            self.counters["expirations"] += 1
+            entry = None
+        if entry is None:
+            self.counters["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.lru[entry["ns"]].move_to_end(key)
+        self.counters["hits"] += 1
+        return entry
+
+    def set(self, key, data, ts=None):
+        if key in self.entries:
+            self._drop(key)
+        ns = self.namespace(key)
+        size = len(json.dumps(data, separators=(",", ":"), default=str))
+        ts = datetime.now(timezone.utc).timestamp() if ts is None else ts
+        self.entries[key] = {"data": data, "ts": ts, "size": size, "ns": ns}
+        in_ns = self.lru.setdefault(ns, OrderedDict())
+        in_ns[key] = None
+        self.bytes += size
+        while len(in_ns) > self._limits(ns)["max_entries"]:
+            self._drop(next(iter(in_ns)))
+            self.counters["evictions"] += 1
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            self._drop(next(iter(self.entries)))
+            self.counters["evictions"] += 1
+
+    def purge_expired(self):
+        now = datetime.now(timezone.utc).timestamp()
+        for key in [k for k, e in self.entries.items() if self._expired(e, now)]:
+            self._drop(key)
+            self.counters["expirations"] += 1
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def clear(self):
+        self.entries.clear()
+        self.lru.clear()
+        self.bytes = 0
+
+    def stats(self):
+        per_ns = {}
+        for entry in self.entries.values():
+            ns = per_ns.setdefault(entry["ns"], {"entries": 0, "bytes": 0})
+            ns["entries"] += 1
+            ns["bytes"] += entry["size"]
+        return {**self.counters, "entries": len(self.entries), "bytes": self.bytes,
+                "max_bytes": self.max_bytes, "namespaces": per_ns}
+
+
+def _cache_namespace(name, max_entries):
+    prefix = f"CACHE_{name.upper()}_"
+    return {
+        "max_entries": int(os.environ.get(prefix + "MAX_ENTRIES", max_entries)),
+        "max_age": REFRESH_POLICIES[name]["max_stale"],
+    }
+
+_cache = BoundedCache(
+    max_bytes=int(os.environ.get('CACHE_MAX_BYTES', str(32 * 1024 * 1024))),
+    namespaces={
+        "top_coins": _cache_namespace("top_coins", 4),
+        "trending": _cache_namespace("trending", 1),
+        "global": _cache_namespace("global", 1),
+        "exchange_rates": _cache_namespace("exchange_rates", 1),
+        # One entry per coin from /api/crypto/price; see PriceBatcher.
+        "price:": {
+            "max_entries": int(os.environ.get('CACHE_PRICE_MAX_ENTRIES', '2000')),
+            "max_age": float(os.environ.get('PRICE_MAX_STALE', '900')),
+        },
+    },
+)
+
+
+# Shared cache backends let several uvicorn workers share one copy of each
+# market key. The local BoundedCache stays in front as an L1; the shared
+# backend is consulted when the local entry is missing or expired, and a
+# per-key lease makes sure only one worker goes upstream at a time.
+class MemoryBackend:
+    name = "memory"
+
+    async def get(self, key):
+        return None
+
+    async def set(self, key, entry, ttl):
+        pass
+
+    async def acquire(self, key, lease_seconds):
+        return "local"
+
+    async def release(self, key, token):
+        pass
+
+    async def close(self):
+        pass
+
+
+class FileBackend:
+    # One JSON file per key, replaced atomically. Pointed at /dev/shm (the
+    # default where available) this is a shared-memory store.
+    name = "file"
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.leases = {}
+
+    def _path(self, key, suffix):
+        return self.directory / (re.sub(r"[^\w.-]", "_", key) + suffix)
+
+    async def get(self, key):
+        try:
+            entry = json.loads(self._path(key, ".json").read_bytes())
+        except FileNotFoundError:
+            return None
+        if entry["expires"] < datetime.now(timezone.utc).timestamp():
+            return None
+        return entry
+
+    async def set(self, key, entry, ttl):
+        path = self._path(key, ".json")
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(json.dumps({**entry, "expires": entry["ts"] + ttl}, separators=(",", ":")).encode())
+        os.replace(tmp, path)
+
+    async def acquire(self, key, lease_seconds):
+        # A lease is an flock on the key's lease file, held until release.
+        # The kernel drops it if the holder dies, so no worker ever breaks
+        # another's lease, and lease files are never unlinked. A holder that
+        # hangs is outwaited by the caller's lease_seconds deadline instead.
+        fd = os.open(self._path(key, ".lease"), os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        token = uuid.uuid4().hex
+        self.leases[token] = fd
+        return token
+
+    async def release(self, key, token):
+        fd = self.leases.pop(token, None)
+        if fd is not None:
+            os.close(fd)
+
+    async def close(self):
+        for fd in self.leases.values():
+            os.close(fd)
+        self.leases.clear()
+
+
+class RedisBackend:
+    # Uses GET, SET and one EVAL (compare-and-delete on release), so any
+    # Redis-protocol server with scripting, or an in-process stand-in with the
+    # same async methods, can be plugged in.
+    name = "redis"
+    RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+    def __init__(self, redis_client, prefix="wealthx:"):
+        self.redis = redis_client
+        self.prefix = prefix
+
+    async def get(self, key):
+        raw = await self.redis.get(self.prefix + key)
+        return json.loads(raw) if raw else None
+
+    async def set(self, key, entry, ttl):
+        await self.redis.set(self.prefix + key, json.dumps(entry, separators=(",", ":")), ex=max(1, int(ttl)))
+
+    async def acquire(self, key, lease_seconds):
+        token = uuid.uuid4().hex
+        acquired = await self.redis.set(self.prefix + "lease:" + key, token, nx=True, px=int(lease_seconds * 1000))
+        return token if acquired else None
+
+    async def release(self, key, token):
+        # Atomic, so a lease that expired and was taken over is never deleted.
+        await self.redis.eval(self.RELEASE_SCRIPT, 1, self.prefix + "lease:" + key, token)
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def make_shared_cache(backend):
+    if backend == "file":
+        default_dir = Path("/dev/shm") if Path("/dev/shm").is_dir() else Path(tempfile.gettempdir())
+        return FileBackend(os.environ.get('CACHE_DIR', str(default_dir / "wealthx-cache")))
+    if backend == "redis":
+        import redis.asyncio as aioredis
+        return RedisBackend(aioredis.from_url(os.environ.get('REDIS_URL', 'redis://localhost:6379/0')))
+    return MemoryBackend()
+
+_shared_cache = make_shared_cache(os.environ.get('CACHE_BACKEND', 'memory').lower())
+SHARED_LEASE_SECONDS = float(os.environ.get('CACHE_LEASE_SECONDS', '30'))
+SHARED_POLL_SECONDS = 0.1
 
 FALLBACK_COINS = [
     {"id":"bitcoin","name":"Bitcoin","symbol":"BTC","image":"https://assets.coingecko.com/coins/images/1/large/bitcoin.png","current_price":97250.00,"market_cap":1920000000000,"market_cap_rank":1,"price_change_percentage_24h":1.85,"total_volume":42000000000,"sparkline_in_7d":[]},
@@ -121,56 +615,842 @@ TEAM_MEMBERS = [
 ]
 
 
-async def seed_schemes():
-    count = await db.schemes.count_documents({})
-    if count == 0:
+# Indexes are declared here and created at startup; create_index is a no-op
+# for indexes that already exist.
+INDEXES = {
+    "schemes": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("is_active", ASCENDING), ("min_investment", ASCENDING)], name="active_min_investment"),
+    ],
+    "settings": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "newsletter": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "price_history": [
+        IndexModel([("coin_id", ASCENDING), ("ts", ASCENDING)], name="coin_ts"),
+    ],
+    "price_candles": [
+        IndexModel([("coin_id", ASCENDING), ("interval", ASCENDING), ("start", ASCENDING)], name="coin_interval_start", unique=True),
+    ],
+}
+
+# Representative queries from the request handlers, checked with explain().
+INDEXED_QUERIES = {
+    "schemes.active_by_min_investment": ("schemes", {"is_active": True}, [("min_investment", ASCENDING)]),
+    "schemes.by_id": ("schemes", {"id": ""}, None),
+    "settings.by_id": ("settings", {"id": "site_settings"}, None),
+    "newsletter.by_email": ("newsletter", {"email": ""}, None),
+}
+
+
+async def _create_index(collection, index):
+    try:
+        await db[collection].create_indexes([index])
+    except Exception as e:
+        logging.error(f"Could not create index {index.document['name']} on {collection}: {e}")
+
+
+async def ensure_indexes():
+    await asyncio.gather(*[_create_index(c, index) for c, indexes in INDEXES.items() for index in indexes])
+
+
+def _plan_stages(plan):
+    yield plan
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            yield from _plan_stages(child)
+
+
+async def explain_index_usage():
+    report = {}
+    for name, (collection, query, sort) in INDEXED_QUERIES.items():
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = (await cursor.explain())["queryPlanner"]["winningPlan"]
+        stages = list(_plan_stages(plan.get("queryPlan", plan)))
+        report[name] = {
+            "indexes": [st["indexName"] for st in stages if "indexName" in st],
+            "collscan": any(st.get("stage") == "COLLSCAN" for st in stages),
+        }
+    return report
+
+
+async def verify_index_usage():
+    try:
+        report = await explain_index_usage()
+    except Exception as e:
+        logging.warning(f"Could not verify index usage: {e}")
+        return
+    for name, usage in report.items():
+        if usage["collscan"]:
+            logging.warning(f"Query {name} is a collection scan")
+
+
+async def _seed_default_schemes():
+    if await db.schemes.count_documents({}, limit=1) == 0:
         await db.schemes.insert_many(DEFAULT_SCHEMES)
+        await invalidate_content("schemes")
         logging.info("Seeded default schemes")
-    settings = await db.settings.find_one({"id": "site_settings"}, {"_id": 0})
-    if not settings:
+
+
+async def _seed_default_settings():
+    if await db.settings.find_one({"id": "site_settings"}, {"_id": 1}) is None:
         await db.settings.insert_one(DEFAULT_SETTINGS)
+        await invalidate_content("settings")
         logging.info("Seeded default settings")
 
 
-@app.on_event("startup")
-async def startup():
-    await seed_schemes()
+async def seed_schemes():
+    await asyncio.gather(_seed_default_schemes(), _seed_default_settings())
 
 
-async def cached_fetch(key, url, ttl_seconds=120, fallback=None):
-    now = datetime.now(timezone.utc).timestamp()
-    if key in _cache and (now - _cache[key]["ts"]) < ttl_seconds:
-        return _cache[key]["data"]
+def upstream_timeout(seconds):
+    return httpx.Timeout(seconds, connect=min(seconds, UPSTREAM_CONNECT_TIMEOUT))
+
+
+def get_http_client():
+    global http_client
+    if http_client is None or http_client.is_closed:
+        http2 = UPSTREAM_HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logging.warning("UPSTREAM_HTTP2 is set but h2 is not installed; using HTTP/1.1")
+                http2 = False
+        http_client = httpx.AsyncClient(
+            http2=http2,
+            timeout=upstream_timeout(UPSTREAM_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+                keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+            ),
+            headers={"Accept": "application/json"},
+        )
+    return http_client
+
+
+# --- Upstream scheduler ---
+# All CoinGecko calls draw from one token bucket sized to the plan's quota
+# (split across WEB_CONCURRENCY workers). Calls made for a waiting request
+# are served before background refreshes. A 429 blocks the whole bucket for
+# Retry-After (or an exponential backoff) instead of sleeping inside one
+# request, and request handlers never wait for a token: cached_fetch answers
+# from cache or fallback and lets the queued fetch fill the cache later.
+UPSTREAM_USER = 0
+UPSTREAM_BACKGROUND = 1
+
+
+class UpstreamScheduler:
+    def __init__(self, rate_per_minute, burst, max_backoff=120.0):
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.max_backoff = max_backoff
+        self.backoff = 0.0
+        self.blocked_until = 0.0
+        self.updated = None
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.timer = None
+        self.counters = {"granted": 0, "queued": 0, "rate_limited": 0, "throttled": 0, "over_budget": 0, "hedged": 0}
+
+    def _now(self):
+        return asyncio.get_running_loop().time()
+
+    def _refill(self):
+        now = self._now()
+        if self.updated is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready(self):
+        self._refill()
+        return not self.waiters and self.tokens >= 1 and self._now() >= self.blocked_until
+
+    async def acquire(self, priority):
+        if self.ready():
+            self.tokens -= 1
+            self.counters["granted"] += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.sequence), future))
+        self.counters["queued"] += 1
+        self._pump()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.tokens += 1
+            raise
+
+    def _pump(self):
+        self.timer = None
+        self._refill()
+        now = self._now()
+        while self.waiters and self.tokens >= 1 and now >= self.blocked_until:
+            _, _, future = heapq.heappop(self.waiters)
+            if future.done():
+                continue
+            self.tokens -= 1
+            self.counters["granted"] += 1
+            future.set_result(None)
+        if self.waiters and self.timer is None:
+            delay = max(self.blocked_until - now, (1 - self.tokens) / self.rate, 0.01)
+            self.timer = asyncio.get_running_loop().call_later(delay, self._pump)
+
+    def rate_limited(self, retry_after):
+        self.counters["rate_limited"] += 1
+        self.backoff = min(max(self.backoff * 2, 2.0), self.max_backoff)
+        wait = retry_after if retry_after is not None else self.backoff
+        self.blocked_until = max(self.blocked_until, self._now() + wait)
+        logging.warning(f"CoinGecko rate limit hit; pausing upstream calls for {wait:.0f}s")
+
+    def succeeded(self):
+        self.backoff = 0.0
+
+    def stats(self):
+        self._refill()
+        return {
+            **self.counters,
+            "tokens": round(self.tokens, 2),
+            "burst": self.burst,
+            "rate_per_minute": round(self.rate * 60, 2),
+            "waiting": sum(1 for _, _, f in self.waiters if not f.done()),
+            "blocked_for": round(max(0.0, self.blocked_until - self._now()), 1),
+        }
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+upstream = UpstreamScheduler(
+    rate_per_minute=float(os.environ.get('COINGECKO_RATE_PER_MINUTE', '30')) / int(os.environ.get('WEB_CONCURRENCY', '1')),
+    burst=int(os.environ.get('COINGECKO_BURST', '5')),
+)
+
+
+# --- Circuit breakers ---
+# One breaker per CoinGecko endpoint. After BREAKER_FAILURES consecutive
+# transport errors, timeouts or 5xx responses the breaker opens and calls to
+# that endpoint fail immediately, so cached_fetch answers from cache or
+# fallback without waiting on timeouts. Once BREAKER_COOLDOWN has passed a
+# single probe is let through (half-open); its outcome closes the breaker or
+# opens it again. A probe that never reports back is replaced after another
+# cooldown.
+BREAKER_FAILURES = int(os.environ.get('BREAKER_FAILURES', '5'))
+BREAKER_COOLDOWN = float(os.environ.get('BREAKER_COOLDOWN', '30'))
+BREAKER_TRANSITIONS = {"open": "opened", "half-open": "half_opened", "closed": "closed"}
+
+
+class CircuitBreaker:
+    def __init__(self, name, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.name = name
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.consecutive = 0
+        self.changed_at = 0.0
+        self.counters = {"opened": 0, "half_opened": 0, "closed": 0, "rejected": 0, "failures": 0}
+
+    def _now(self):
+        return asyncio.get_running_loop().time()
+
+    def _transition(self, state):
+        logging.warning(f"CoinGecko circuit for {self.name}: {self.state} -> {state}")
+        self.state = state
+        self.changed_at = self._now()
+        self.counters[BREAKER_TRANSITIONS[state]] += 1
+
+    def allow(self):
+        if self.state == "closed":
+            return True
+        if self._now() - self.changed_at >= self.cooldown:
+            # Either the open period is over, or the last probe went missing.
+            self._transition("half-open")
+            return True
+        self.counters["rejected"] += 1
+        return False
+
+    def succeeded(self):
+        self.consecutive = 0
+        if self.state != "closed":
+            self._transition("closed")
+
+    def failed(self):
+        self.counters["failures"] += 1
+        self.consecutive += 1
+        if self.state == "half-open" or (self.state == "closed" and self.consecutive >= self.failures):
+            self._transition("open")
+
+    def stats(self):
+        return {
+            **self.counters,
+            "state": self.state,
+            "consecutive_failures": self.consecutive,
+        }
+
+
+_breakers = {}
+
+
+def breaker_for(url):
+    name = url.split("?", 1)[0].removeprefix(COINGECKO_BASE)
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name)
+    return breaker
+
+
+async def _hedged_get(url, timeout, breaker, hedge_after):
+    # A second request is only sent while the breaker is closed and a token
+    # is spare, so hedging never queues behind or starves other calls.
+    client = get_http_client()
+    first = asyncio.ensure_future(client.get(url, timeout=timeout))
+    if hedge_after is None:
+        return await first
+    tasks = [first]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if done or breaker.state != "closed" or not upstream.ready():
+            return await first
+        await upstream.acquire(UPSTREAM_USER)
+        upstream.counters["hedged"] += 1
+        tasks.append(asyncio.ensure_future(client.get(url, timeout=timeout)))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+        return first.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _get_json(url, timeout, priority=UPSTREAM_USER, throttled=None, hedge_after=None):
+    breaker = breaker_for(url)
+    if priority != UPSTREAM_USER:
+        hedge_after = None
     for attempt in range(3):
+        if not breaker.allow():
+            upstream_responses.inc(breaker.name, "circuit_open")
+            raise HTTPException(status_code=503, detail="CoinGecko unavailable")
         try:
-            async with httpx.AsyncClient(timeout=15.0) as http_client:
-                resp = await http_client.get(url, headers={"Accept": "application/json"})
-                if resp.status_code == 429:
-                    if attempt < 2:
-                        await asyncio.sleep(2 * (attempt + 1))
-                        continue
-                    if key in _cache: return _cache[key]["data"]
-                    if fallback is not None: return fallback
-                    raise HTTPException(status_code=429, detail="Rate limit")
-                resp.raise_for_status()
-                data = resp.json()
-                _cache[key] = {"data": data, "ts": now}
-                return data
-        except httpx.HTTPStatusError:
-            if key in _cache: return _cache[key]["data"]
-            if fallback is not None: return fallback
+            if throttled is not None and not upstream.ready():
+                throttled.set()
+            with profile_phase("upstream_wait", breaker.name):
+                await upstream.acquire(priority)
+            started = asyncio.get_running_loop().time()
+            try:
+                with profile_phase("upstream", breaker.name):
+                    resp = await _hedged_get(url, upstream_timeout(timeout), breaker, hedge_after)
+            except Exception:
+                upstream_responses.inc(breaker.name, "error")
+                raise
+            finally:
+                upstream_request_seconds.observe(asyncio.get_running_loop().time() - started, breaker.name)
+            upstream_responses.inc(breaker.name, str(resp.status_code))
+            # A 429 still proves the endpoint is up; only 5xx trips the breaker.
+            if resp.status_code >= 500:
+                breaker.failed()
+            else:
+                breaker.succeeded()
+            if resp.status_code == 429:
+                upstream.rate_limited(parse_retry_after(resp.headers.get("Retry-After")))
+                raise HTTPException(status_code=429, detail="Rate limit")
+            resp.raise_for_status()
+            upstream.succeeded()
+            return resp.json()
+        except (httpx.HTTPStatusError, HTTPException):
             raise
         except Exception:
+            breaker.failed()
             if attempt < 2:
                 await asyncio.sleep(1)
                 continue
-            if key in _cache: return _cache[key]["data"]
-            if fallback is not None: return fallback
             raise
-    if fallback is not None: return fallback
     raise HTTPException(status_code=503, detail="Unable to fetch data")
 
 
+async def _download(spec, priority, throttled=None):
+    # A list of URLs is fetched concurrently and the pages concatenated.
+    url, timeout, hedge_after = spec["url"], spec["timeout"], spec["hedge_after"]
+    if isinstance(url, list):
+        pages = await asyncio.gather(*[_get_json(u, timeout, priority, throttled, hedge_after) for u in url])
+        data = [item for page in pages for item in page]
+    else:
+        data = await _get_json(url, timeout, priority, throttled, hedge_after)
+    if spec["transform"] is not None:
+        data = spec["transform"](data)
+    return data
+
+
+async def _shared(op, *args, default=None):
+    # A broken shared backend degrades to per-worker caching, never to errors.
+    try:
+        return await getattr(_shared_cache, op)(*args)
+    except Exception as e:
+        logging.warning(f"Shared cache {op} failed: {e}")
+        return default
+
+
+def _notify_update(key, origin):
+    # origin is "upstream" for data this worker fetched itself and "shared"
+    # for data adopted from another worker.
+    for listener in _cache_listeners:
+        try:
+            listener(key, origin)
+        except Exception as e:
+            logging.error(f"Cache listener failed for {key}: {e}")
+
+
+def _adopt_shared(key, shared, local_ts, ttl_seconds):
+    if shared is None or shared["ts"] <= local_ts:
+        return False
+    if datetime.now(timezone.utc).timestamp() - shared["ts"] >= ttl_seconds:
+        return False
+    _cache.set(key, shared["data"], ts=shared["ts"])
+    _notify_update(key, "shared")
+    return True
+
+
+async def _fetch_upstream(key, spec, priority, throttled):
+    local = _cache.peek(key)
+    local_ts = local["ts"] if local is not None else 0
+    shared = await _shared("get", key)
+    if _adopt_shared(key, shared, local_ts, spec["ttl"]):
+        return shared["data"]
+    token = await _shared("acquire", key, SHARED_LEASE_SECONDS, default="local")
+    if token is None:
+        # Another worker is refreshing this key; wait for it to publish,
+        # or take over once its lease lapses.
+        deadline = asyncio.get_running_loop().time() + SHARED_LEASE_SECONDS
+        while token is None and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(SHARED_POLL_SECONDS)
+            shared = await _shared("get", key)
+            if _adopt_shared(key, shared, local_ts, spec["ttl"]):
+                return shared["data"]
+            token = await _shared("acquire", key, SHARED_LEASE_SECONDS, default="local")
+    try:
+        data = await _download(spec, priority, throttled)
+        ts = datetime.now(timezone.utc).timestamp()
+        _cache.set(key, data, ts=ts)
+        _notify_update(key, "upstream")
+        await _shared("set", key, {"data": data, "ts": ts}, _cache.max_age(key))
+        return data
+    finally:
+        if token is not None:
+            await _shared("release", key, token)
+
+
+def _release_inflight(key, task):
+    # Only the task that registered itself may clear the slot, and its
+    # exception is always retrieved so an unawaited failure is not logged twice.
+    if _inflight.get(key) is task:
+        del _inflight[key]
+        del _inflight_throttled[key]
+    if not task.cancelled():
+        task.exception()
+
+
+def _start_fetch(key, spec, priority=UPSTREAM_USER):
+    # Single-flight: concurrent misses on the same key share one upstream call.
+    # The fetch runs as its own task and is shielded by waiters, so a cancelled
+    # waiter neither aborts the fetch for the others nor leaves a stale
+    # registry entry.
+    # The fetch sets its throttled event when it has to queue for the
+    # upstream token bucket.
+    task = _inflight.get(key)
+    if task is None:
+        throttled = asyncio.Event()
+        task = asyncio.ensure_future(_fetch_upstream(key, spec, priority, throttled))
+        _inflight[key] = task
+        _inflight_throttled[key] = throttled
+        task.add_done_callback(lambda t: _release_inflight(key, t))
+    return task
+
+
+async def cached_fetch(key, url, ttl_seconds=120, fallback=None, timeout=UPSTREAM_TIMEOUT, policy=None, transform=None, slo=None):
+    with profile_phase("cache", key):
+        now = datetime.now(timezone.utc).timestamp()
+        slo = LATENCY_SLOS.get(slo, {})
+        spec = {"url": url, "ttl": ttl_seconds, "timeout": timeout, "transform": transform, "hedge_after": slo.get("hedge_after")}
+        if policy is not None:
+            _refresh_targets[key] = {**_refresh_targets.get(key, {}), "spec": spec, "policy": policy, "last_used": now}
+        entry = _cache.get(key)
+        if entry is not None:
+            age = now - entry["ts"]
+            if age < ttl_seconds:
+                return _serve_cached(key, entry, ttl_seconds, fallback)
+            if policy is not None and age < REFRESH_POLICIES[policy]["max_stale"]:
+                # Stale-while-revalidate: answer from memory and refresh behind it
+                # at background priority, since no request waits on it.
+                _start_fetch(key, spec, UPSTREAM_BACKGROUND)
+                return _serve_cached(key, entry, ttl_seconds, fallback)
+        task = _start_fetch(key, spec)
+        throttled = _inflight_throttled[key]
+        waiter = asyncio.ensure_future(throttled.wait())
+        try:
+            await asyncio.wait({task, waiter}, timeout=slo.get("budget"), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+        if not task.done():
+            # Queued for upstream quota or over the latency budget: the fetch
+            # fills the cache later, and this request is answered without it.
+            entry = _cache.peek(key)
+            if entry is not None or fallback is not None:
+                upstream.counters["throttled" if throttled.is_set() else "over_budget"] += 1
+                return _serve_cached(key, entry, ttl_seconds, fallback)
+        try:
+            data = await asyncio.shield(task)
+        except Exception:
+            entry = _cache.peek(key)
+            if entry is None and fallback is None:
+                raise
+            return _serve_cached(key, entry, ttl_seconds, fallback)
+        cache_served.inc(key, "fetched")
+        return data
+
+
+def _serve_cached(key, entry, ttl_seconds, fallback):
+    if entry is None:
+        cache_served.inc(key, "fallback")
+        return fallback
+    age = datetime.now(timezone.utc).timestamp() - entry["ts"]
+    cache_served.inc(key, "fresh" if age < ttl_seconds else "stale")
+    return entry["data"]
+
+
+def cache_headers(key, ttl_seconds):
+    entry = _cache.peek(key)
+    if entry is None:
+        return {"X-Cache-Status": "fallback"}
+    age = datetime.now(timezone.utc).timestamp() - entry["ts"]
+    return {"X-Cache-Status": "fresh" if age < ttl_seconds else "stale", "X-Cache-Age": str(int(age))}
+
+
+def set_cache_headers(response, key, ttl_seconds):
+    response.headers.update(cache_headers(key, ttl_seconds))
+
+
+def snapshot_version(key, data):
+    # The cache timestamp identifies a snapshot; anything else is fallback data.
+    entry = _cache.peek(key)
+    return entry["ts"] if entry is not None and entry["data"] is data else "fallback"
+
+
+async def _refresh(key, target):
+    try:
+        await asyncio.shield(_start_fetch(key, target["spec"], UPSTREAM_BACKGROUND))
+    except Exception as e:
+        target["due"] = datetime.now(timezone.utc).timestamp() + REFRESH_RETRY_SECONDS
+        logging.warning(f"Background refresh of {key} failed: {e}")
+
+
+async def _refresh_loop():
+    while True:
+        now = datetime.now(timezone.utc).timestamp()
+        for key, target in list(_refresh_targets.items()):
+            policy = REFRESH_POLICIES[target["policy"]]
+            if now - target["last_used"] > policy["max_stale"]:
+                # Nobody has asked for this key in a while; let it expire.
+                del _refresh_targets[key]
+                continue
+            entry = _cache.peek(key)
+            if entry is None:
+                # Evicted or never filled; the next request re-registers it.
+                if key not in _inflight:
+                    del _refresh_targets[key]
+                continue
+            ts = entry["ts"]
+            if target.get("ts") != ts:
+                target["ts"] = ts
+                target["due"] = ts + policy["interval"] + random.uniform(-policy["jitter"], policy["jitter"])
+            if now >= target["due"] and key not in _inflight:
+                asyncio.ensure_future(_refresh(key, target))
+        _cache.purge_expired()
+        await asyncio.sleep(REFRESH_TICK)
+
+
+# --- Cache snapshot ---
+# The market cache is checkpointed to one local file every
+# CACHE_SNAPSHOT_INTERVAL seconds (when it has changed) and at shutdown, and
+# reloaded at startup with its original timestamps: a restarted process
+# answers from the last snapshot straight away and only the entries past
+# their TTL are refreshed. The file is msgpack + zstd when those are
+# installed, JSON + gzip otherwise; load() tells them apart by magic bytes.
+CACHE_SNAPSHOT_PATH = Path(os.environ.get('CACHE_SNAPSHOT_PATH', str(ROOT_DIR / "snapshot" / "cache.snapshot")))
+CACHE_SNAPSHOT_INTERVAL = float(os.environ.get('CACHE_SNAPSHOT_INTERVAL', '60'))
+SNAPSHOT_FORMAT = 1
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+GZIP_MAGIC = b"\x1f\x8b"
+_snapshot_task = None
+_snapshot_marker = None
+
+
+def _snapshot_marker_of(entries):
+    return tuple((key, entry["ts"]) for key, entry in entries.items())
+
+
+def _encode_snapshot(entries):
+    payload = {"format": SNAPSHOT_FORMAT, "entries": [[key, entry["ts"], entry["data"]] for key, entry in entries.items()]}
+    if msgpack is not None:
+        body = msgpack.packb(payload, default=str)
+    else:
+        body = json.dumps(payload, separators=(",", ":"), default=str).encode()
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    return gzip.compress(body, compresslevel=6)
+
+
+def _decode_snapshot(blob):
+    if blob.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise ValueError("snapshot is zstd-compressed but zstandard is not installed")
+        body = zstandard.ZstdDecompressor().decompress(blob)
+    elif blob.startswith(GZIP_MAGIC):
+        body = gzip.decompress(blob)
+    else:
+        raise ValueError("unknown snapshot compression")
+    if body[:1] in (b"{", b"["):
+        return json.loads(body)
+    if msgpack is None:
+        raise ValueError("snapshot is msgpack-encoded but msgpack is not installed")
+    return msgpack.unpackb(body)
+
+
+def _write_snapshot_file(blob):
+    CACHE_SNAPSHOT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = CACHE_SNAPSHOT_PATH.with_name(f"{CACHE_SNAPSHOT_PATH.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, CACHE_SNAPSHOT_PATH)
+
+
+async def save_cache_snapshot():
+    global _snapshot_marker
+    entries = {key: {"ts": entry["ts"], "data": entry["data"]} for key, entry in _cache.entries.items()}
+    marker = _snapshot_marker_of(entries)
+    if marker == _snapshot_marker:
+        return
+    try:
+        blob = await asyncio.to_thread(_encode_snapshot, entries)
+        await asyncio.to_thread(_write_snapshot_file, blob)
+    except Exception as e:
+        logging.warning(f"Cache snapshot failed: {e}")
+        return
+    _snapshot_marker = marker
+    logging.info(f"Cache snapshot written: {len(entries)} entries, {len(blob)} bytes")
+
+
+async def load_cache_snapshot():
+    global _snapshot_marker
+    try:
+        blob = await asyncio.to_thread(CACHE_SNAPSHOT_PATH.read_bytes)
+        payload = await asyncio.to_thread(_decode_snapshot, blob)
+    except FileNotFoundError:
+        return 0
+    except Exception as e:
+        logging.warning(f"Ignoring unreadable cache snapshot {CACHE_SNAPSHOT_PATH}: {e}")
+        return 0
+    if payload.get("format") != SNAPSHOT_FORMAT:
+        return 0
+    now = datetime.now(timezone.utc).timestamp()
+    loaded = 0
+    for key, ts, data in payload["entries"]:
+        # Entries past the namespace max_age would be dropped on first read.
+        if key in _cache or now - ts > _cache.max_age(key):
+            continue
+        _cache.set(key, data, ts=ts)
+        loaded += 1
+    _snapshot_marker = _snapshot_marker_of(_cache.entries)
+    logging.info(f"Cache snapshot loaded: {loaded} entries")
+    return loaded
+
+
+async def _snapshot_loop():
+    while True:
+        await asyncio.sleep(CACHE_SNAPSHOT_INTERVAL)
+        await save_cache_snapshot()
+
+
+# --- Response rendering ---
+# Hot JSON payloads are encoded, hashed and compressed once per data version
+# rather than once per request. Renders are looked up by (name, version); with
+# no version the body is still encoded per request, but the ETag check and the
+# compressed variants are reused. The cache is bounded both by entry count and
+# by the bytes held in bodies and compressed variants.
+RENDER_CACHE_SIZE = int(os.environ.get('RENDER_CACHE_SIZE', '256'))
+RENDER_CACHE_MAX_BYTES = int(os.environ.get('RENDER_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+COMPRESS_MIN_BYTES = 512
+_rendered = OrderedDict()
+_rendered_bytes = 0
+
+
+def _encode_json(payload):
+    return json.dumps(payload, separators=(",", ":"), default=str).encode()
+
+
+def _encode_msgpack(payload):
+    return msgpack.packb(payload, use_bin_type=True, default=str)
+
+
+def _build_body(name, build, encode):
+    with profile_phase("render", name):
+        return encode(build())
+
+
+def render_json(name, version, build, encode=_encode_json, media_type="application/json"):
+    if version is None:
+        body = _build_body(name, build, encode)
+        version = hashlib.blake2b(body, digest_size=16).hexdigest()
+    else:
+        body = None
+    key = (name, version)
+    rendered = _rendered.get(key)
+    if rendered is not None:
+        _rendered.move_to_end(key)
+        return rendered
+    if body is None:
+        body = _build_body(name, build, encode)
+    rendered = {"body": body, "media_type": media_type, "key": key, "size": 0,
+                "etag": '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'}
+    _rendered[key] = rendered
+    _render_grew(rendered, len(body))
+    return rendered
+
+
+def _render_grew(rendered, size):
+    # Compressed variants are added to a render after it is cached; they only
+    # count while it is still in the cache.
+    global _rendered_bytes
+    rendered["size"] += size
+    if _rendered.get(rendered["key"]) is not rendered:
+        return
+    _rendered_bytes += size
+    while len(_rendered) > 1 and (len(_rendered) > RENDER_CACHE_SIZE or _rendered_bytes > RENDER_CACHE_MAX_BYTES):
+        _, evicted = _rendered.popitem(last=False)
+        _rendered_bytes -= evicted["size"]
+
+
+def _accepted_encodings(header):
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _coding_etag(etag, coding):
+    # Each content coding is a different representation, so it gets its own
+    # strong ETag: "<hash>-br", "<hash>-gzip".
+    return etag if coding is None else f'{etag[:-1]}-{coding}"'
+
+
+def _etag_matches(header, etag):
+    # Any coding's tag validates the render: they all carry the same hash.
+    if header.strip() == "*":
+        return True
+    tags = {t.strip().removeprefix("W/") for t in header.split(",")}
+    return any(_coding_etag(etag, coding) in tags for coding in (None, "br", "gzip"))
+
+
+def _response_coding(request, rendered):
+    if len(rendered["body"]) < COMPRESS_MIN_BYTES:
+        return None
+    accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def json_response(request, rendered, headers=None):
+    coding = _response_coding(request, rendered)
+    headers = dict(headers or {})
+    headers.update({
+        "ETag": _coding_etag(rendered["etag"], coding),
+        "Vary": ", ".join(filter(None, [headers.get("Vary"), "Accept-Encoding"])),
+        "Cache-Control": "no-cache",
+    })
+    if _etag_matches(request.headers.get("if-none-match", ""), rendered["etag"]):
+        return Response(status_code=304, headers=headers)
+    body = rendered["body"]
+    if coding is not None and coding not in rendered:
+        if coding == "br":
+            rendered["br"] = brotli.compress(body, quality=5)
+        else:
+            rendered["gzip"] = gzip.compress(body, compresslevel=6)
+        _render_grew(rendered, len(rendered[coding]))
+    if coding is not None:
+        body, headers["Content-Encoding"] = rendered[coding], coding
+    return Response(content=body, media_type=rendered["media_type"], headers=headers)
+
+
+# --- Content cache ---
+# Schemes and settings only change through the admin endpoints, so they are
+# served from memory. Each group carries a version token in the
+# content_versions collection, next to the data it describes, so every worker
+# sees it whatever CACHE_BACKEND is; a write replaces the token, and every
+# worker notices within CONTENT_VERSION_CHECK_SECONDS and reloads from Mongo.
+CONTENT_VERSION_CHECK_SECONDS = float(os.environ.get('CONTENT_VERSION_CHECK_SECONDS', '1'))
+_content_cache = {}
+_content_versions = {}
+
+
+async def content_version(group):
+    now = asyncio.get_running_loop().time()
+    seen = _content_versions.get(group)
+    if seen is not None and now - seen[1] < CONTENT_VERSION_CHECK_SECONDS:
+        return seen[0]
+    doc = await db.content_versions.find_one({"_id": group})
+    version = doc["version"] if doc else "0"
+    _content_versions[group] = (version, now)
+    return version
+
+
+async def invalidate_content(group):
+    version = uuid.uuid4().hex
+    _content_versions[group] = (version, asyncio.get_running_loop().time())
+    await db.content_versions.update_one({"_id": group}, {"$set": {"version": version}}, upsert=True)
+
+
+async def read_through(name, group, load):
+    # The version is read before loading, so a write racing with the load
+    # leaves this entry behind the new version and it is reloaded next time.
+    version = await content_version(group)
+    entry = _content_cache.get(name)
+    if entry is None or entry["version"] != version:
+        entry = {"data": await load(), "version": version}
+        _content_cache[name] = entry
+    return entry
+
+
 def verify_admin(password: str):
     if password != ADMIN_PASSWORD:
         raise HTTPException(status_code=401, detail="Invalid password")
@@ -209,11 +1489,18 @@ class SchemeUpdate(BaseModel):
     is_active: Optional[bool] = None
 
 
+async def schemes_entry(active_only=True):
+    async def load():
+        query = {"is_active": True} if active_only else {}
+        return await db.schemes.find(query, {"_id": 0}).sort("min_investment", 1).to_list(100)
+
+    return await read_through(f"schemes:{active_only}", "schemes", load)
+
+
 @api_router.get("/schemes")
-async def get_schemes(active_only: bool = True):
-    query = {"is_active": True} if active_only else {}
-    schemes = await db.schemes.find(query, {"_id": 0}).sort("min_investment", 1).to_list(100)
-    return {"schemes": schemes}
+async def get_schemes(request: Request, active_only: bool = True):
+    entry = await schemes_entry(active_only)
+    return json_response(request, render_json(f"schemes:{active_only}", entry["version"], lambda: {"schemes": entry["data"]}))
 
 
 @api_router.post("/admin/schemes")
@@ -223,6 +1510,7 @@ async def create_scheme(scheme: SchemeCreate, x_admin_password: str = Header(Non
     doc["id"] = str(uuid.uuid4())
     doc["created_at"] = datetime.now(timezone.utc).isoformat()
     await db.schemes.insert_one(doc)
+    await invalidate_content("schemes")
     return {"message": "Scheme created", "id": doc["id"]}
 
 
@@ -235,6 +1523,7 @@ async def update_scheme(scheme_id: str, scheme: SchemeUpdate, x_admin_password:
     result = await db.schemes.update_one({"id": scheme_id}, {"$set": update_data})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Scheme not found")
+    await invalidate_content("schemes")
     return {"message": "Scheme updated"}
 
 
@@ -244,16 +1533,23 @@ async def delete_scheme(scheme_id: str, x_admin_password: str = Header(None)):
     result = await db.schemes.delete_one({"id": scheme_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Scheme not found")
+    await invalidate_content("schemes")
     return {"message": "Scheme deleted"}
 
 
 # --- Settings ---
+async def settings_entry():
+    async def load():
+        settings = await db.settings.find_one({"id": "site_settings"}, {"_id": 0})
+        return settings or DEFAULT_SETTINGS
+
+    return await read_through("settings", "settings", load)
+
+
 @api_router.get("/settings")
-async def get_settings():
-    settings = await db.settings.find_one({"id": "site_settings"}, {"_id": 0})
-    if not settings:
-        return DEFAULT_SETTINGS
-    return settings
+async def get_settings(request: Request):
+    entry = await settings_entry()
+    return json_response(request, render_json("settings", entry["version"], lambda: entry["data"]))
 
 
 class SettingsUpdate(BaseModel):
@@ -267,9 +1563,28 @@ async def update_settings(data: SettingsUpdate, x_admin_password: str = Header(N
         raise HTTPException(status_code=400, detail="No fields to update")
     update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
     await db.settings.update_one({"id": "site_settings"}, {"$set": update_data}, upsert=True)
+    await invalidate_content("settings")
     return {"message": "Settings updated"}
 
 
+# --- Stats ---
+@api_router.get("/admin/stats")
+async def get_stats(x_admin_password: str = Header(None)):
+    verify_admin(x_admin_password)
+    return {
+        "cache": {**_cache.stats(), "backend": _shared_cache.name},
+        "upstream": upstream.stats(),
+        "breakers": {name: breaker.stats() for name, breaker in _breakers.items()},
+        "prices": price_batcher.stats(),
+    }
+
+
+@api_router.get("/admin/indexes")
+async def get_index_usage(x_admin_password: str = Header(None)):
+    verify_admin(x_admin_password)
+    return {"queries": await explain_index_usage()}
+
+
 # --- Team ---
 @api_router.get("/team")
 async def get_team():
@@ -282,38 +1597,310 @@ async def root():
     return {"message": "Crypto Investment API"}
 
 
+def normalize_coins(data):
+    coins = []
+    for coin in data:
+        sparkline = coin.get("sparkline_in_7d") or {}
+        coins.append({
+            "id": coin.get("id"),
+            "name": coin.get("name"),
+            "symbol": (coin.get("symbol") or "").upper(),
+            "image": coin.get("image"),
+            "current_price": coin.get("current_price"),
+            "market_cap": coin.get("market_cap"),
+            "market_cap_rank": coin.get("market_cap_rank"),
+            "price_change_percentage_24h": coin.get("price_change_percentage_24h"),
+            "total_volume": coin.get("total_volume"),
+            "sparkline_in_7d": sparkline.get("price", []) if isinstance(sparkline, dict) else sparkline,
+        })
+    return coins[:TOP_COINS_MAX]
+
+
+def top_coins_urls():
+    per_page = min(TOP_COINS_MAX, COINGECKO_PAGE_SIZE)
+    pages = -(-TOP_COINS_MAX // per_page)
+    return [
+        f"{COINGECKO_BASE}/coins/markets?vs_currency=usd&order=market_cap_desc&per_page={per_page}&page={page}&sparkline=true&price_change_percentage=24h,7d"
+        for page in range(1, pages + 1)
+    ]
+
+
+async def fetch_top_coins():
+    return await cached_fetch("top_coins", top_coins_urls(), ttl_seconds=120, fallback=FALLBACK_COINS,
+                              timeout=UPSTREAM_TIMEOUTS["top_coins"], policy="top_coins", transform=normalize_coins,
+                              slo="top_coins")
+
+
+def clamp_limit(limit):
+    return max(1, min(limit, TOP_COINS_MAX))
+
+
+# --- Sparklines ---
+# Sparklines dominate the top-coins payload but are drawn a few dozen pixels
+# wide. They are downsampled with Largest-Triangle-Three-Buckets, vectorized
+# across every coin of a snapshot at once, and the result is cached per
+# (snapshot, points, encoding). Requested points are rounded up to one of
+# SPARKLINE_RESOLUTIONS, so clients cannot fan the caches out one value at a
+# time; anything above the largest gets the full series.
+SPARKLINE_ENCODINGS = ("json", "delta", "f32")
+SPARKLINE_RESOLUTIONS = (8, 16, 30, 60, 120)
+SPARKLINE_DELTA_LEVELS = 4095
+SPARKLINE_CACHE_SIZE = 32
+_sparkline_cache = OrderedDict()
+
+
+def lttb(series, points):
+    # series is (coins, n); returns (coins, points) keeping first and last.
+    rows, n = series.shape
+    if points >= n or points < 3:
+        return series
+    every = (n - 2) / (points - 2)
+    picked = np.empty((rows, points), dtype=np.intp)
+    picked[:, 0], picked[:, -1] = 0, n - 1
+    row_idx = np.arange(rows)
+    a = np.zeros(rows, dtype=np.intp)
+    for i in range(points - 2):
+        lo, hi = int(i * every) + 1, int((i + 1) * every) + 1
+        next_lo, next_hi = hi, min(int((i + 2) * every) + 1, n)
+        avg_x = (next_lo + next_hi - 1) / 2
+        avg_y = series[:, next_lo:next_hi].mean(axis=1)
+        ay = series[row_idx, a]
+        xs = np.arange(lo, hi)
+        area = np.abs((a - avg_x)[:, None] * (series[:, lo:hi] - ay[:, None])
+                      - (a[:, None] - xs[None, :]) * (avg_y - ay)[:, None])
+        a = lo + area.argmax(axis=1)
+        picked[:, i + 1] = a
+    return series[row_idx[:, None], picked]
+
+
+def _encode_sparkline(values, encoding):
+    if encoding == "f32":
+        return base64.b64encode(values.astype("<f4").tobytes()).decode()
+    if encoding == "delta":
+        # value[i] = base + scale * sum(deltas[:i + 1])
+        base = float(values[0])
+        scale = float(values.max() - values.min()) / SPARKLINE_DELTA_LEVELS or 1.0
+        levels = np.rint((values - base) / scale).astype(np.int64)
+        return {"base": base, "scale": scale, "deltas": np.diff(levels, prepend=0).tolist()}
+    return values.tolist()
+
+
+def encoded_sparklines(coins, version, points, encoding):
+    key = (version, points, encoding)
+    cached = _sparkline_cache.get(key)
+    if cached is not None:
+        _sparkline_cache.move_to_end(key)
+        return cached
+    result = [[] for _ in coins]
+    by_length = {}
+    for i, coin in enumerate(coins):
+        if coin["sparkline_in_7d"]:
+            by_length.setdefault(len(coin["sparkline_in_7d"]), []).append(i)
+    for length, indices in by_length.items():
+        series = np.array([coins[i]["sparkline_in_7d"] for i in indices], dtype=float)
+        if np.isnan(series).any():
+            fill = np.nan_to_num(np.nanmean(series, axis=1, keepdims=True))
+            series = np.where(np.isnan(series), fill, series)
+        if points:
+            series = lttb(series, points)
+        for i, values in zip(indices, series):
+            result[i] = _encode_sparkline(values, encoding)
+    _sparkline_cache[key] = result
+    while len(_sparkline_cache) > SPARKLINE_CACHE_SIZE:
+        _sparkline_cache.popitem(last=False)
+    return result
+
+
+def top_coins_payload(data, version, limit, points=None, encoding="json"):
+    if not points and encoding == "json":
+        return {"coins": data[:limit]}
+    sparklines = encoded_sparklines(data, version, points, encoding)
+    return {
+        "coins": [{**coin, "sparkline_in_7d": spark} for coin, spark in zip(data[:limit], sparklines)],
+        "sparkline": {"points": points, "encoding": encoding},
+    }
+
+
+# --- Columnar formats ---
+# The coin list can also be sent as a struct of arrays, as JSON or
+# MessagePack, so large limits do not repeat every key for every coin. The
+# full-length columns are built once per snapshot and sliced per limit, and
+# the encoded body is cached like any other render.
+COIN_COLUMNS = ("id", "name", "symbol", "image", "current_price", "market_cap", "market_cap_rank",
+                "price_change_percentage_24h", "total_volume", "sparkline_in_7d")
+RESPONSE_FORMATS = {
+    "json": "application/json",
+    "columnar": "application/vnd.wealthx.columnar+json",
+    "msgpack": "application/msgpack",
+}
+_columns_cache = OrderedDict()
+
+
+def negotiate_format(request, fmt):
+    if fmt is None:
+        accept = request.headers.get("accept", "")
+        if "application/msgpack" in accept or "application/x-msgpack" in accept:
+            fmt = "msgpack"
+        elif RESPONSE_FORMATS["columnar"] in accept:
+            fmt = "columnar"
+        else:
+            fmt = "json"
+    if fmt not in RESPONSE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(RESPONSE_FORMATS)}")
+    if fmt == "msgpack" and msgpack is None:
+        raise HTTPException(status_code=406, detail="MessagePack is not available")
+    return fmt
+
+
+def coin_columns(data, version, points, encoding):
+    key = (version, points, encoding)
+    columns = _columns_cache.get(key)
+    if columns is None:
+        columns = {field: [coin.get(field) for coin in data] for field in COIN_COLUMNS}
+        if points or encoding != "json":
+            columns["sparkline_in_7d"] = encoded_sparklines(data, version, points, encoding)
+        _columns_cache[key] = columns
+        while len(_columns_cache) > SPARKLINE_CACHE_SIZE:
+            _columns_cache.popitem(last=False)
+    return columns
+
+
+def top_coins_columnar(data, version, limit, points=None, encoding="json"):
+    columns = coin_columns(data, version, points, encoding)
+    payload = {"count": len(data[:limit]), "columns": {field: values[:limit] for field, values in columns.items()}}
+    if points or encoding != "json":
+        payload["sparkline"] = {"points": points, "encoding": encoding}
+    return payload
+
+
+def render_top_coins(data, version, limit, points, encoding, fmt):
+    name = f"top_coins:{limit}:{points}:{encoding}:{fmt}"
+    if fmt == "json":
+        return render_json(name, version, lambda: top_coins_payload(data, version, limit, points, encoding))
+    encode = _encode_msgpack if fmt == "msgpack" else _encode_json
+    return render_json(name, version, lambda: top_coins_columnar(data, version, limit, points, encoding),
+                       encode=encode, media_type=RESPONSE_FORMATS[fmt])
+
+
+def sparkline_options(points, encoding):
+    if encoding not in SPARKLINE_ENCODINGS:
+        raise HTTPException(status_code=400, detail=f"encoding must be one of {', '.join(SPARKLINE_ENCODINGS)}")
+    if points is not None and points < 1:
+        raise HTTPException(status_code=400, detail="points must be a positive integer")
+    if points:
+        points = next((r for r in SPARKLINE_RESOLUTIONS if r >= points), None)
+    return points, encoding
+
+
+# --- Currency conversion ---
+# Market data is only ever fetched in USD. Other currencies are derived from
+# that snapshot and CoinGecko's exchange rates (one cached fetch, BTC-based,
+# rebased to USD here): every price, market cap, volume and sparkline point
+# of a snapshot is scaled in one NumPy multiply, and the converted snapshot
+# is cached per (currency, snapshot version, rates version). Its version
+# string carries all three, so the render, sparkline and ETag caches key on
+# it like on any other snapshot.
+QUOTE_FIELDS = ("current_price", "market_cap", "total_volume")
+QUOTE_CACHE_SIZE = int(os.environ.get('QUOTE_CACHE_SIZE', '16'))
+_quote_cache = OrderedDict()
+
+
+def normalize_rates(data):
+    rates = data["rates"]
+    usd = rates["usd"]["value"]
+    return {
+        code: {"rate": rate["value"] / usd, "name": rate.get("name"), "unit": rate.get("unit"), "type": rate.get("type")}
+        for code, rate in rates.items()
+    }
+
+
+async def fetch_exchange_rates():
+    # The empty fallback lets a cold cache answer as soon as the fetch is
+    # throttled or over budget instead of waiting it out.
+    return await cached_fetch("exchange_rates", f"{COINGECKO_BASE}/exchange_rates", ttl_seconds=600, fallback={},
+                              policy="exchange_rates", transform=normalize_rates, slo="exchange_rates")
+
+
+async def currency_rates(currency):
+    # Checked against the rates rather than falling back to USD, so a bad
+    # currency is a 400 and missing rates are a 503.
+    try:
+        rates = await fetch_exchange_rates()
+    except Exception as e:
+        logging.error(f"Exchange rates unavailable: {e}")
+        rates = None
+    if not rates:
+        raise HTTPException(status_code=503, detail="Exchange rates unavailable")
+    if currency not in rates:
+        raise HTTPException(status_code=400, detail=f"currency must be one of {', '.join(sorted(rates))}")
+    return rates
+
+
+def _none_for_nan(values):
+    return [None if v != v else v for v in values]
+
+
+def quote_coins(data, version, currency, rates):
+    rates_version = snapshot_version("exchange_rates", rates)
+    key = (currency, version, rates_version)
+    quoted = _quote_cache.get(key)
+    if quoted is not None:
+        _quote_cache.move_to_end(key)
+        return quoted
+    # Scalars and every sparkline point go into one flat array; None (NaN
+    # after the cast) passes through the multiply and is restored below.
+    sparklines = [coin.get("sparkline_in_7d") or [] for coin in data]
+    scalars = np.array([[coin.get(field) for field in QUOTE_FIELDS] for coin in data], dtype=float).reshape(-1)
+    points = np.array([v for spark in sparklines for v in spark], dtype=float)
+    values = np.concatenate([scalars, points]) * rates[currency]["rate"]
+    converted_scalars = values[:scalars.size].reshape(len(data), len(QUOTE_FIELDS))
+    offsets = np.cumsum([scalars.size] + [len(spark) for spark in sparklines])
+    coins = []
+    for coin, row, start, end in zip(data, converted_scalars, offsets[:-1], offsets[1:]):
+        spark = values[start:end].tolist()
+        coins.append({
+            **coin,
+            **dict(zip(QUOTE_FIELDS, _none_for_nan(row.tolist()))),
+            "sparkline_in_7d": _none_for_nan(spark) if np.isnan(values[start:end]).any() else spark,
+        })
+    quoted = (coins, f"{version}:{currency}:{rates_version}")
+    _quote_cache[key] = quoted
+    while len(_quote_cache) > QUOTE_CACHE_SIZE:
+        _quote_cache.popitem(last=False)
+    return quoted
+
+
 @api_router.get("/crypto/top-coins")
-async def get_top_coins(limit: int = 20):
-    url = f"{COINGECKO_BASE}/coins/markets?vs_currency=usd&order=market_cap_desc&per_page={limit}&page=1&sparkline=true&price_change_percentage=24h,7d"
+async def get_top_coins(request: Request, limit: int = 20, points: Optional[int] = None, encoding: str = "json",
+                        fmt: Optional[str] = Query(None, alias="format"), currency: str = "usd"):
+    # Every limit is a prefix of one cached snapshot of the largest page, so
+    # limit=10 and limit=20 share a single upstream fetch, and every currency
+    # is derived from that same USD snapshot.
+    limit = clamp_limit(limit)
+    points, encoding = sparkline_options(points, encoding)
+    fmt = negotiate_format(request, fmt)
+    currency = currency.lower()
+    fetches = [fetch_top_coins()]
+    if currency != "usd":
+        fetches.append(currency_rates(currency))
     try:
-        data = await cached_fetch(f"top_coins_{limit}", url, ttl_seconds=120, fallback=FALLBACK_COINS[:limit])
-        if isinstance(data, list) and len(data) > 0 and "id" in data[0]:
-            return {"coins": data[:limit]}
-        coins = []
-        for coin in data:
-            coins.append({
-                "id": coin.get("id"),
-                "name": coin.get("name"),
-                "symbol": coin.get("symbol", "").upper(),
-                "image": coin.get("image"),
-                "current_price": coin.get("current_price"),
-                "market_cap": coin.get("market_cap"),
-                "market_cap_rank": coin.get("market_cap_rank"),
-                "price_change_percentage_24h": coin.get("price_change_percentage_24h"),
-                "total_volume": coin.get("total_volume"),
-                "sparkline_in_7d": coin.get("sparkline_in_7d", {}).get("price", []),
-            })
-        return {"coins": coins}
+        data, *rates = await asyncio.gather(*fetches)
+        version = snapshot_version("top_coins", data)
+        if rates:
+            data, version = quote_coins(data, version, currency, rates[0])
+        rendered = render_top_coins(data, version, limit, points, encoding, fmt)
+        return json_response(request, rendered, {**cache_headers("top_coins", 120), "Vary": "Accept"})
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error: {e}")
         return {"coins": FALLBACK_COINS[:limit]}
 
 
-@api_router.get("/crypto/trending")
-async def get_trending():
+async def trending_payload():
     url = f"{COINGECKO_BASE}/search/trending"
     try:
-        data = await cached_fetch("trending", url, ttl_seconds=300, fallback={"coins": []})
+        data = await cached_fetch("trending", url, ttl_seconds=300, fallback={"coins": []}, timeout=UPSTREAM_TIMEOUTS["trending"], policy="trending", slo="trending")
         if "trending" in data: return data
         trending = []
         for item in data.get("coins", [])[:10]:
@@ -329,11 +1916,17 @@ async def get_trending():
         return {"trending": FALLBACK_TRENDING}
 
 
-@api_router.get("/crypto/global")
-async def get_global_stats():
+@api_router.get("/crypto/trending")
+async def get_trending(response: Response):
+    payload = await trending_payload()
+    set_cache_headers(response, "trending", 300)
+    return payload
+
+
+async def global_payload():
     url = f"{COINGECKO_BASE}/global"
     try:
-        data = await cached_fetch("global", url, ttl_seconds=300, fallback={"data": {}})
+        data = await cached_fetch("global", url, ttl_seconds=300, fallback={"data": {}}, timeout=UPSTREAM_TIMEOUTS["global"], policy="global", slo="global")
         if "total_market_cap" in data: return data
         gdata = data.get("data", {})
         if not gdata: return FALLBACK_GLOBAL
@@ -350,28 +1943,921 @@ async def get_global_stats():
         return FALLBACK_GLOBAL
 
 
-# --- Newsletter ---
-import re
+@api_router.get("/crypto/global")
+async def get_global_stats(response: Response):
+    payload = await global_payload()
+    set_cache_headers(response, "global", 300)
+    return payload
+
+
+# --- Spot prices ---
+# Prices for arbitrary coin ids. Lookups that miss the per-coin cache are
+# queued for PRICE_BATCH_WINDOW seconds, deduplicated against everything
+# already queued or in flight, and sent as one /simple/price call per
+# PRICE_BATCH_MAX ids. Each coin's quote (or None for ids CoinGecko does not
+# know) is cached under price:<id> for PRICE_TTL seconds, and served stale
+# up to PRICE_MAX_STALE when CoinGecko cannot be reached. A request waits on
+# its batch only within the "price" latency budget and not at all once the
+# batch is queued for upstream quota; the ids still pending are answered
+# stale or listed as missing, and their batch fills the cache behind it.
+PRICE_TTL = float(os.environ.get('PRICE_TTL', '60'))
+PRICE_BATCH_WINDOW = float(os.environ.get('PRICE_BATCH_WINDOW', '0.05'))
+PRICE_BATCH_MAX = int(os.environ.get('PRICE_BATCH_MAX', '100'))
+PRICE_MAX_IDS = 250
+COIN_ID_PATTERN = re.compile(r"^[a-z0-9][a-z0-9._-]*$")
+
+
+class PriceBatcher:
+    def __init__(self, window, max_batch):
+        self.window = window
+        self.max_batch = max_batch
+        self.futures = {}
+        self.pending = OrderedDict()
+        # Set when the batch a coin is queued in has to wait for quota; every
+        # coin of one batching window shares the window's event.
+        self.throttled = {}
+        self.window_throttled = None
+        self.timer = None
+        self.counters = {"lookups": 0, "joined": 0, "batches": 0, "coins": 0, "failures": 0}
+
+    async def lookup(self, coin_ids, budget=None):
+        # Returns {id: quote or None} for the ids whose batch completed within
+        # budget; a failed batch yields its exception. Ids left out are still
+        # queued or in flight, or their batch is waiting for upstream quota.
+        loop = asyncio.get_running_loop()
+        futures = {}
+        for coin_id in coin_ids:
+            self.counters["lookups"] += 1
+            future = self.futures.get(coin_id)
+            if future is None:
+                if self.window_throttled is None:
+                    self.window_throttled = asyncio.Event()
+                future = self.futures[coin_id] = loop.create_future()
+                self.pending[coin_id] = future
+                self.throttled[coin_id] = self.window_throttled
+            else:
+                self.counters["joined"] += 1
+            futures[coin_id] = future
+        if len(self.pending) >= self.max_batch:
+            self._flush()
+        elif self.pending and self.timer is None:
+            self.timer = loop.call_later(self.window, self._flush)
+        # Nothing here cancels the futures: an abandoned lookup still lets its
+        # batch complete and fill the cache.
+        results = asyncio.gather(*futures.values(), return_exceptions=True)
+        waiters = [asyncio.ensure_future(e.wait()) for e in {self.throttled[c] for c in futures}]
+        try:
+            await asyncio.wait({results, *waiters}, timeout=budget, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+        return {coin_id: f.exception() or f.result() for coin_id, f in futures.items() if f.done()}
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        throttled, self.window_throttled = self.window_throttled, None
+        while self.pending:
+            batch = {}
+            while self.pending and len(batch) < self.max_batch:
+                coin_id, future = self.pending.popitem(last=False)
+                batch[coin_id] = future
+            task = asyncio.ensure_future(self._fetch(batch, throttled))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+
+    async def _fetch(self, batch, throttled):
+        self.counters["batches"] += 1
+        self.counters["coins"] += len(batch)
+        url = (f"{COINGECKO_BASE}/simple/price?ids={','.join(batch)}&vs_currencies=usd"
+               f"&include_market_cap=true&include_24hr_vol=true&include_24hr_change=true&include_last_updated_at=true")
+        try:
+            data = await _get_json(url, UPSTREAM_TIMEOUT, throttled=throttled,
+                                   hedge_after=LATENCY_SLOS["price"]["hedge_after"])
+        except Exception as e:
+            self.counters["failures"] += 1
+            logging.warning(f"Price batch of {len(batch)} coins failed: {e}")
+            for coin_id, future in batch.items():
+                del self.futures[coin_id]
+                del self.throttled[coin_id]
+                future.set_exception(e)
+                # Waiters that went away must not leave an unretrieved error.
+                future.exception()
+            return
+        ts = datetime.now(timezone.utc).timestamp()
+        for coin_id, future in batch.items():
+            quote = data.get(coin_id)
+            _cache.set(f"price:{coin_id}", quote, ts=ts)
+            del self.futures[coin_id]
+            del self.throttled[coin_id]
+            future.set_result(quote)
+
+    def stats(self):
+        return {**self.counters, "queued": len(self.pending), "in_flight": len(self.futures) - len(self.pending)}
+
+
+price_batcher = PriceBatcher(PRICE_BATCH_WINDOW, PRICE_BATCH_MAX)
+
+
+def parse_coin_ids(ids):
+    coin_ids = list(dict.fromkeys(i.strip().lower() for i in ids.split(",") if i.strip()))
+    if not coin_ids:
+        raise HTTPException(status_code=400, detail="ids must list at least one coin id")
+    if len(coin_ids) > PRICE_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"at most {PRICE_MAX_IDS} ids per request")
+    invalid = [i for i in coin_ids if not COIN_ID_PATTERN.match(i)]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"invalid coin ids: {', '.join(invalid[:5])}")
+    return coin_ids
+
+
+@api_router.get("/crypto/price")
+async def get_prices(response: Response, ids: str):
+    coin_ids = parse_coin_ids(ids)
+    now = datetime.now(timezone.utc).timestamp()
+    quotes, misses, status = {}, [], "fresh"
+    for coin_id in coin_ids:
+        entry = _cache.get(f"price:{coin_id}")
+        if entry is not None and now - entry["ts"] < PRICE_TTL:
+            quotes[coin_id] = entry["data"]
+        else:
+            misses.append(coin_id)
+    if misses:
+        results = await price_batcher.lookup(misses, budget=LATENCY_SLOS["price"]["budget"])
+        if len(results) < len(misses):
+            throttled = any(price_batcher.throttled[c].is_set() for c in misses if c not in results)
+            upstream.counters["throttled" if throttled else "over_budget"] += 1
+        for coin_id in misses:
+            result = results.get(coin_id)
+            if coin_id in results and not isinstance(result, Exception):
+                quotes[coin_id] = result
+                continue
+            entry = _cache.peek(f"price:{coin_id}")
+            if entry is not None:
+                quotes[coin_id] = entry["data"]
+                status = "stale" if status == "fresh" else status
+            else:
+                # Still pending, or its batch failed, with nothing cached.
+                status = "fallback"
+    response.headers["X-Cache-Status"] = status
+    return {
+        "prices": {coin_id: quote for coin_id, quote in quotes.items() if quote is not None},
+        "missing": [coin_id for coin_id in coin_ids if quotes.get(coin_id) is None],
+    }
+
+
+# --- Live stream ---
+# Server-sent events fed by the background refresher: each top_coins update is
+# encoded once per distinct (limit, points), with the same downsampled
+# sparklines as /crypto/top-coins, and pushed to every subscriber's bounded
+# queue. A subscriber whose queue is full is disconnected instead of letting
+# its backlog grow.
+STREAM_QUEUE_SIZE = int(os.environ.get('STREAM_QUEUE_SIZE', '8'))
+STREAM_HEARTBEAT_SECONDS = float(os.environ.get('STREAM_HEARTBEAT_SECONDS', '15'))
+_stream_clients = {}
+
+
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n".encode()
+
+
+def _drop_stream_client(client_id):
+    client = _stream_clients.pop(client_id, None)
+    if client is None:
+        return
+    queue = client["queue"]
+    while not queue.empty():
+        queue.get_nowait()
+    queue.put_nowait(None)
+
+
+def _publish_coins(key, origin):
+    if key != "top_coins" or not _stream_clients:
+        return
+    entry = _cache.peek(key)
+    version = snapshot_version(key, entry["data"])
+    messages = {}
+    for client_id, client in list(_stream_clients.items()):
+        shape = (client["limit"], client["points"])
+        if shape not in messages:
+            messages[shape] = _sse("coins", {**top_coins_payload(entry["data"], version, *shape), "ts": entry["ts"]})
+        try:
+            client["queue"].put_nowait(messages[shape])
+        except asyncio.QueueFull:
+            logging.info(f"Dropping slow stream subscriber {client_id}")
+            _drop_stream_client(client_id)
+
+_cache_listeners.append(_publish_coins)
+
+
+async def _stream_events(client_id, first):
+    queue = _stream_clients[client_id]["queue"]
+    try:
+        yield first
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # Keep the refresher running for as long as anyone is listening.
+                target = _refresh_targets.get("top_coins")
+                if target is not None:
+                    target["last_used"] = datetime.now(timezone.utc).timestamp()
+                yield b": ping\n\n"
+                continue
+            if message is None:
+                break
+            yield message
+    finally:
+        _stream_clients.pop(client_id, None)
+
+
+@api_router.get("/crypto/stream")
+async def stream_coins(limit: int = 20, points: Optional[int] = None):
+    limit = clamp_limit(limit)
+    points, _ = sparkline_options(points, "json")
+    data = await fetch_top_coins()
+    entry = _cache.peek("top_coins")
+    client_id = uuid.uuid4().hex
+    _stream_clients[client_id] = {"queue": asyncio.Queue(STREAM_QUEUE_SIZE), "limit": limit, "points": points}
+    payload = top_coins_payload(data, snapshot_version("top_coins", data), limit, points)
+    first = _sse("coins", {**payload, "ts": entry["ts"] if entry is not None else None})
+    return StreamingResponse(
+        _stream_events(client_id, first),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# --- Price history ---
+# Every top-coins snapshot this worker fetches from upstream is appended to a
+# MongoDB time-series collection, and the common intervals are rolled up into
+# price_candles as they arrive. /crypto/history serves those rollups directly
+# and resamples raw points with pandas for the other intervals; every read is
+# a bounded range scan on (coin_id, time).
+HISTORY_INTERVALS = {"1m": 60, "5m": 300, "15m": 900, "1h": 3600, "4h": 14400, "1d": 86400}
+HISTORY_ROLLUPS = ("1h", "1d")
+HISTORY_RETENTION_SECONDS = int(os.environ.get('HISTORY_RETENTION_SECONDS', str(90 * 86400)))
+HISTORY_MAX_CANDLES = 1000
+HISTORY_MAX_POINTS = 50000
+_background_tasks = set()
+
+
+async def ensure_history_collection():
+    try:
+        if "price_history" not in await db.list_collection_names():
+            await db.create_collection(
+                "price_history",
+                timeseries={"timeField": "ts", "metaField": "coin_id", "granularity": "minutes"},
+                expireAfterSeconds=HISTORY_RETENTION_SECONDS,
+            )
+    except Exception as e:
+        # Servers without time-series support fall back to a plain collection.
+        logging.warning(f"Could not create price_history as a time-series collection: {e}")
+
+
+def _bucket_start(ts, seconds):
+    return datetime.fromtimestamp(ts - ts % seconds, timezone.utc)
+
+
+async def record_snapshot(coins, ts):
+    when = datetime.fromtimestamp(ts, timezone.utc)
+    points = [
+        {"ts": when, "coin_id": c["id"], "price": c["current_price"], "market_cap": c["market_cap"], "volume": c["total_volume"]}
+        for c in coins if c.get("id") and c.get("current_price") is not None
+    ]
+    if not points:
+        return
+    rollups = [
+        UpdateOne(
+            {"coin_id": p["coin_id"], "interval": interval, "start": _bucket_start(ts, HISTORY_INTERVALS[interval])},
+            {"$setOnInsert": {"open": p["price"]}, "$max": {"high": p["price"]},
+             "$min": {"low": p["price"]}, "$set": {"close": p["price"]}},
+            upsert=True,
+        )
+        for p in points for interval in HISTORY_ROLLUPS
+    ]
+    try:
+        await asyncio.gather(
+            db.price_history.insert_many(points, ordered=False),
+            db.price_candles.bulk_write(rollups, ordered=False),
+        )
+    except Exception as e:
+        logging.error(f"Could not record price history: {e}")
+
 
+def _record_history(key, origin):
+    if key != "top_coins" or origin != "upstream":
+        return
+    entry = _cache.peek(key)
+    task = asyncio.ensure_future(record_snapshot(entry["data"], entry["ts"]))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+_cache_listeners.append(_record_history)
+
+
+def _as_utc(dt):
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+async def load_candles(coin_id, interval, start, end):
+    if interval in HISTORY_ROLLUPS:
+        cursor = db.price_candles.find(
+            {"coin_id": coin_id, "interval": interval, "start": {"$gte": start, "$lt": end}},
+            {"_id": 0, "start": 1, "open": 1, "high": 1, "low": 1, "close": 1},
+        ).sort("start", ASCENDING)
+        docs = await cursor.to_list(HISTORY_MAX_CANDLES)
+        return [[int(_as_utc(d["start"]).timestamp()), d["open"], d["high"], d["low"], d["close"]] for d in docs]
+    cursor = db.price_history.find(
+        {"coin_id": coin_id, "ts": {"$gte": start, "$lt": end}}, {"_id": 0, "ts": 1, "price": 1},
+    ).sort("ts", DESCENDING)
+    docs = await cursor.to_list(HISTORY_MAX_POINTS)
+    if not docs:
+        return []
+    prices = pd.Series(
+        np.fromiter((d["price"] for d in docs), dtype=float, count=len(docs)),
+        index=pd.DatetimeIndex([_as_utc(d["ts"]) for d in docs]),
+    ).sort_index()
+    ohlc = prices.resample(f"{HISTORY_INTERVALS[interval]}s").ohlc().dropna()
+    starts = (ohlc.index - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)
+    return [[int(t), *row] for t, row in zip(starts, ohlc.to_numpy().tolist())]
+
+
+@api_router.get("/crypto/history/{coin_id}")
+async def get_price_history(request: Request, coin_id: str, interval: str = "1h", start: Optional[int] = None,
+                            end: Optional[int] = None, limit: int = 200):
+    if interval not in HISTORY_INTERVALS:
+        raise HTTPException(status_code=400, detail=f"interval must be one of {', '.join(HISTORY_INTERVALS)}")
+    limit = max(1, min(limit, HISTORY_MAX_CANDLES))
+    step = HISTORY_INTERVALS[interval]
+    end_dt = datetime.fromtimestamp(end, timezone.utc) if end else datetime.now(timezone.utc)
+    start_dt = datetime.fromtimestamp(start, timezone.utc) if start else end_dt - timedelta(seconds=step * limit)
+    # Never scan more than limit candles' worth of time.
+    start_dt = max(start_dt, end_dt - timedelta(seconds=step * limit))
+    candles = await load_candles(coin_id, interval, start_dt, end_dt)
+    payload = {"coin_id": coin_id, "interval": interval, "fields": ["t", "o", "h", "l", "c"], "candles": candles[-limit:]}
+    return json_response(request, render_json(f"history:{coin_id}:{interval}", None, lambda: payload))
+
+
+# --- Bootstrap ---
+# One request for everything a page needs on load. Sections are assembled
+# concurrently from their caches; a section that errors or overruns its own
+# timeout gets its fallback payload, and the rest of the response is unaffected.
+async def _bootstrap_schemes(params):
+    return {"schemes": (await schemes_entry())["data"]}
+
+
+async def _bootstrap_settings(params):
+    return (await settings_entry())["data"]
+
+
+async def _bootstrap_team(params):
+    return {"team": TEAM_MEMBERS}
+
+
+async def _bootstrap_top_coins(params):
+    data = await fetch_top_coins()
+    return top_coins_payload(data, snapshot_version("top_coins", data), params["limit"], params["points"])
+
+
+async def _bootstrap_global(params):
+    return await global_payload()
+
+
+async def _bootstrap_trending(params):
+    return await trending_payload()
+
+
+def _bootstrap_section(loader, timeout, fallback):
+    name = loader.__name__.removeprefix("_bootstrap_")
+    return name, {
+        "load": loader,
+        "timeout": float(os.environ.get(f"BOOTSTRAP_TIMEOUT_{name.upper()}", timeout)),
+        "fallback": fallback,
+    }
+
+BOOTSTRAP_SECTIONS = dict([
+    _bootstrap_section(_bootstrap_schemes, 2.0, lambda params: {"schemes": []}),
+    _bootstrap_section(_bootstrap_settings, 2.0, lambda params: DEFAULT_SETTINGS),
+    _bootstrap_section(_bootstrap_team, 1.0, lambda params: {"team": TEAM_MEMBERS}),
+    _bootstrap_section(_bootstrap_top_coins, 1.5, lambda params: {"coins": FALLBACK_COINS[:params["limit"]]}),
+    _bootstrap_section(_bootstrap_global, 1.5, lambda params: FALLBACK_GLOBAL),
+    _bootstrap_section(_bootstrap_trending, 1.5, lambda params: {"trending": FALLBACK_TRENDING}),
+])
+
+
+async def _load_section(name, params):
+    section = BOOTSTRAP_SECTIONS[name]
+    try:
+        return name, await asyncio.wait_for(section["load"](params), section["timeout"]), "ok"
+    except asyncio.TimeoutError:
+        logging.warning(f"Bootstrap section {name} timed out")
+        return name, section["fallback"](params), "timeout"
+    except Exception as e:
+        logging.error(f"Bootstrap section {name} failed: {e}")
+        return name, section["fallback"](params), "error"
+
+
+@api_router.get("/bootstrap")
+async def bootstrap(request: Request, sections: str = ",".join(BOOTSTRAP_SECTIONS), limit: int = 20,
+                    points: Optional[int] = None):
+    names = [n for n in dict.fromkeys(sections.split(",")) if n in BOOTSTRAP_SECTIONS]
+    if not names:
+        raise HTTPException(status_code=400, detail=f"sections must be a subset of {','.join(BOOTSTRAP_SECTIONS)}")
+    params = {"limit": clamp_limit(limit), "points": sparkline_options(points, "json")[0]}
+    results = await asyncio.gather(*[_load_section(name, params) for name in names])
+    payload = {
+        "sections": {name: data for name, data, _ in results},
+        "status": {name: status for name, _, status in results},
+    }
+    return json_response(request, render_json("bootstrap", None, lambda: payload))
+
+
+# --- Newsletter ---
 class NewsletterSubscribe(BaseModel):
     email: str
 
 def is_valid_email(email: str) -> bool:
     return bool(re.match(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', email))
 
+# Subscriptions are acknowledged from memory and written behind in batches.
+# Known addresses are answered from an in-memory index warmed from the
+# collection. Every accepted subscription is appended to a per-worker journal
+# and fsynced before it is acknowledged; concurrent subscriptions share one
+# fsync (group commit). A journal segment is deleted only after its batch is
+# in Mongo, and segments left by dead workers are replayed at startup.
+NEWSLETTER_BATCH_SIZE = int(os.environ.get('NEWSLETTER_BATCH_SIZE', '500'))
+NEWSLETTER_FLUSH_SECONDS = float(os.environ.get('NEWSLETTER_FLUSH_SECONDS', '1'))
+NEWSLETTER_JOURNAL_DIR = Path(os.environ.get('NEWSLETTER_JOURNAL_DIR', str(ROOT_DIR / "journal")))
+_newsletter_emails = set()
+_newsletter_pending = []
+_newsletter_unflushed = []
+_newsletter_journal = None
+_newsletter_segment = 0
+# Appends written so far and appends known to be on disk; the lock admits one
+# fsync or rotation at a time.
+_journal_written = 0
+_journal_synced = 0
+_journal_lock = asyncio.Lock()
+_newsletter_flush_event = asyncio.Event()
+_newsletter_task = None
+_newsletter_warmup = None
+_newsletter_claimed = False
+
+
+def _journal_path():
+    return NEWSLETTER_JOURNAL_DIR / f"newsletter-{os.getpid()}.jsonl"
+
+
+def _journal_append(doc):
+    global _newsletter_journal, _journal_written
+    if _newsletter_journal is None:
+        NEWSLETTER_JOURNAL_DIR.mkdir(parents=True, exist_ok=True)
+        _newsletter_journal = open(_journal_path(), "a")
+    _newsletter_journal.write(json.dumps(doc) + "\n")
+    _newsletter_journal.flush()
+    _journal_written += 1
+    return _journal_written
+
+
+async def _journal_sync(position):
+    # Returns once the append at position is on disk. Appends made while an
+    # fsync runs are covered together by the next one.
+    global _journal_synced
+    async with _journal_lock:
+        if _journal_synced >= position:
+            return
+        if _newsletter_journal is None:
+            # Rotated into a segment whose fsync failed; see _rotate_journal.
+            raise OSError("newsletter journal segment could not be synced")
+        written = _journal_written
+        await asyncio.to_thread(os.fsync, _newsletter_journal.fileno())
+        _journal_synced = written
+
+
+async def _rotate_journal():
+    # Renames the journal into a segment, then swaps out the pending batch and
+    # the journal in the same step, and makes the closed segment durable;
+    # appends during the fsync go to a new journal. If the rename fails
+    # nothing has moved. If the fsync fails the segment is still queued for
+    # Mongo, but its unsynced subscriptions are not acknowledged.
+    global _newsletter_journal, _newsletter_segment, _newsletter_pending, _journal_synced
+    async with _journal_lock:
+        if not _newsletter_pending:
+            return None  # rotated while this call waited for the lock
+        segment = NEWSLETTER_JOURNAL_DIR / f"newsletter-{os.getpid()}-{_newsletter_segment + 1}.flushing"
+        os.replace(_journal_path(), segment)
+        _newsletter_segment += 1
+        journal, _newsletter_journal = _newsletter_journal, None
+        batch, _newsletter_pending = _newsletter_pending, []
+        written = _journal_written
+        try:
+            await asyncio.to_thread(os.fsync, journal.fileno())
+        except Exception:
+            _newsletter_unflushed.append((segment, batch))
+            raise
+        finally:
+            journal.close()
+        _journal_synced = written
+    return segment, batch
+
+
+async def flush_newsletter():
+    rotated = await _rotate_journal() if _newsletter_pending else None
+    if rotated is not None:
+        _newsletter_unflushed.append(rotated)
+    while _newsletter_unflushed:
+        segment, batch = _newsletter_unflushed[0]
+        try:
+            await db.newsletter.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Duplicates (another worker, or a replayed journal) are expected.
+            errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+            if errors:
+                logging.error(f"Newsletter batch failed, will retry: {errors[0].get('errmsg')}")
+                return
+        except Exception as e:
+            logging.error(f"Newsletter batch failed, will retry: {e}")
+            return
+        _newsletter_unflushed.pop(0)
+        segment.unlink(missing_ok=True)
+
+
+async def _newsletter_flusher():
+    while True:
+        try:
+            await asyncio.wait_for(_newsletter_flush_event.wait(), NEWSLETTER_FLUSH_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _newsletter_flush_event.clear()
+        try:
+            await flush_newsletter()
+        except Exception as e:
+            # The batch stays pending or queued; keep flushing.
+            logging.error(f"Newsletter flush failed, will retry: {e}")
+
+
+def _pid_alive(pid):
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _claim_orphan_journals():
+    global _newsletter_segment
+    if not NEWSLETTER_JOURNAL_DIR.is_dir():
+        return
+    for path in sorted(NEWSLETTER_JOURNAL_DIR.glob("newsletter-*")):
+        match = re.match(r"newsletter-(\d+)", path.name)
+        if match is None or _pid_alive(int(match.group(1))):
+            continue
+        _newsletter_segment += 1
+        segment = NEWSLETTER_JOURNAL_DIR / f"newsletter-{os.getpid()}-{_newsletter_segment}.flushing"
+        try:
+            os.replace(path, segment)
+        except FileNotFoundError:
+            continue  # claimed by another worker
+        docs = [json.loads(line) for line in segment.read_text().splitlines() if line.strip()]
+        _newsletter_emails.update(doc["email"] for doc in docs)
+        _newsletter_unflushed.append((segment, docs))
+        logging.info(f"Replaying {len(docs)} journaled newsletter subscriptions from {path.name}")
+
+
+async def _warm_newsletter_emails():
+    try:
+        async for doc in db.newsletter.find({}, {"_id": 0, "email": 1}):
+            _newsletter_emails.add(doc["email"])
+        logging.info(f"Newsletter index warmed with {len(_newsletter_emails)} addresses")
+    except Exception as e:
+        logging.warning(f"Could not warm the newsletter index: {e}")
+
+
+async def start_newsletter_writer():
+    # Orphaned journals are claimed once per process: afterwards, files named
+    # for this pid are this worker's own live journal and segments. The
+    # address index is warmed in the background, however large the
+    # collection; until it is, a known address is answered "success" and
+    # dropped by the unique index at flush. Safe to call again after a failure.
+    global _newsletter_task, _newsletter_warmup, _newsletter_claimed
+    if not _newsletter_claimed:
+        _claim_orphan_journals()
+        _newsletter_claimed = True
+    if _newsletter_task is None or _newsletter_task.done():
+        _newsletter_task = asyncio.create_task(_newsletter_flusher())
+    if _newsletter_warmup is None:
+        _newsletter_warmup = asyncio.create_task(_warm_newsletter_emails())
+
+
+async def stop_newsletter_writer():
+    for task in (_newsletter_task, _newsletter_warmup):
+        if task is not None:
+            task.cancel()
+    await flush_newsletter()
+
+
 @api_router.post("/newsletter/subscribe")
 async def subscribe_newsletter(data: NewsletterSubscribe):
     if not is_valid_email(data.email):
         raise HTTPException(status_code=422, detail="Invalid email address")
-    existing = await db.newsletter.find_one({"email": data.email}, {"_id": 0})
-    if existing:
+    if data.email in _newsletter_emails:
         return {"message": "Already subscribed", "status": "exists"}
     doc = {"id": str(uuid.uuid4()), "email": data.email, "subscribed_at": datetime.now(timezone.utc).isoformat()}
-    await db.newsletter.insert_one(doc)
+    position = _journal_append(doc)
+    _newsletter_emails.add(data.email)
+    _newsletter_pending.append(doc)
+    if len(_newsletter_pending) >= NEWSLETTER_BATCH_SIZE:
+        _newsletter_flush_event.set()
+    await _journal_sync(position)
     return {"message": "Successfully subscribed!", "status": "success"}
 
 
+# --- Metrics endpoint ---
+LOOP_LAG_INTERVAL = float(os.environ.get('LOOP_LAG_INTERVAL', '0.5'))
+_loop_lag_task = None
+
+
+async def _loop_lag_monitor():
+    # How late a sleep wakes up is how long callbacks waited for the loop.
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        event_loop_lag_seconds.observe(max(0.0, loop.time() - started - LOOP_LAG_INTERVAL))
+
+
+class MetricsMiddleware:
+    # Plain ASGI rather than BaseHTTPMiddleware, so streaming responses are
+    # untouched. The route label is the matched path template; latency is
+    # measured to the response start, which for the SSE stream is its setup.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        observed = False
+
+        def observe(status):
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            http_request_seconds.observe(loop.time() - started, scope["method"], path, str(status))
+
+        async def send_timed(message):
+            nonlocal observed
+            if message["type"] == "http.response.start":
+                observed = True
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        except Exception:
+            if not observed:
+                observe(500)
+            raise
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    now = datetime.now(timezone.utc).timestamp()
+    lines += render_samples("cache_lookups_total", "counter", "In-process cache lookups.", ("result",),
+                            [(("hit",), _cache.counters["hits"]), (("miss",), _cache.counters["misses"])])
+    lines += render_samples("cache_removals_total", "counter", "In-process cache removals.", ("reason",),
+                            [(("eviction",), _cache.counters["evictions"]), (("expiration",), _cache.counters["expirations"])])
+    lines += render_samples("cache_bytes", "gauge", "Approximate in-process cache size.", (), [((), _cache.bytes)])
+    lines += render_samples("cache_entry_age_seconds", "gauge", "Age of each cached entry.", ("key",),
+                            [((key,), round(now - entry["ts"], 3)) for key, entry in list(_cache.entries.items())
+                             if entry["ns"] != "price:"])
+    stats = upstream.stats()
+    lines += render_samples("upstream_scheduler_events_total", "counter", "Upstream scheduler decisions.", ("event",),
+                            [((name,), value) for name, value in upstream.counters.items()])
+    lines += render_samples("upstream_tokens", "gauge", "Tokens left in the upstream bucket.", (), [((), stats["tokens"])])
+    lines += render_samples("upstream_waiting", "gauge", "Upstream calls queued for a token.", (), [((), stats["waiting"])])
+    lines += render_samples("upstream_blocked_seconds", "gauge", "Remaining Retry-After pause.", (), [((), stats["blocked_for"])])
+    lines += render_samples("circuit_breaker_open", "gauge", "1 when the endpoint's breaker is not closed.", ("endpoint",),
+                            [((name,), int(b.state != "closed")) for name, b in _breakers.items()])
+    lines += render_samples("circuit_breaker_transitions_total", "counter", "Breaker state changes.", ("endpoint", "to"),
+                            [((name, to), b.counters[counter]) for name, b in _breakers.items()
+                             for to, counter in BREAKER_TRANSITIONS.items()])
+    lines += render_samples("sse_clients", "gauge", "Connected live-stream clients.", (), [((), len(_stream_clients))])
+    return "\n".join(lines) + "\n"
+
+
+@api_router.get("/metrics")
+async def metrics():
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# --- Profiling middleware ---
+# A request is profiled when an admin sends "X-Profile: 1" (the breakdown is
+# returned in a Server-Timing header and logged), when it is picked by
+# PROFILE_SAMPLE_RATE, or for slow-request capture whenever
+# PROFILE_SLOW_SECONDS is set. Profiled requests that are sampled, asked
+# for, or slower than the threshold are logged with their per-phase time.
+# As in MetricsMiddleware, a request is timed to its response start, so a
+# long-lived SSE stream counts only its setup.
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_SLOW_SECONDS = float(os.environ.get('PROFILE_SLOW_SECONDS', '2'))
+
+
+def _server_timing(profile, total):
+    parts = [f"total;dur={total * 1000:.1f}"]
+    for name, (seconds, count) in profile.breakdown():
+        metric = re.sub(r"[^\w.-]", "_", name)
+        parts.append(f'{metric};desc="{name} x{count}";dur={seconds * 1000:.1f}')
+    return ", ".join(parts)
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    def _mode(self, scope):
+        headers = dict(scope["headers"])
+        if headers.get(b"x-profile") == b"1" and headers.get(b"x-admin-password", b"").decode() == ADMIN_PASSWORD:
+            return "requested"
+        if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+            return "sampled"
+        if PROFILE_SLOW_SECONDS:
+            return "slow"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        mode = self._mode(scope) if scope["type"] == "http" else None
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+        profile = RequestProfile()
+        token = _request_profile.set(profile)
+        total = None
+
+        async def send_profiled(message):
+            nonlocal total
+            if message["type"] == "http.response.start":
+                total = time.perf_counter() - profile.started
+                if mode == "requested":
+                    timing = _server_timing(profile, total).encode("latin-1", "replace")
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", timing)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            _request_profile.reset(token)
+            if total is None:
+                total = time.perf_counter() - profile.started
+            # PROFILE_SLOW_SECONDS=0 turns slow capture off rather than
+            # marking every sampled request as slow.
+            slow = bool(PROFILE_SLOW_SECONDS) and total >= PROFILE_SLOW_SECONDS
+            if mode != "slow" or slow:
+                phases = ", ".join(f"{name} {seconds:.3f}s x{count}" for name, (seconds, count) in profile.breakdown())
+                log = logging.warning if slow else logging.info
+                log(f"{'Slow' if slow else 'Profiled'} request {scope['method']} {scope['path']} "
+                    f"took {total:.3f}s ({mode}): {phases or 'no recorded phases'}")
+
+
+# --- Startup ---
+# Startup phases run concurrently, each under its own timeout, and their
+# outcome and duration are recorded. /api/health/ready answers 200 only once
+# every phase has finished and all critical ones succeeded; a failed or
+# overrun non-critical phase (e.g. CoinGecko being down during warm-up) only
+# means serving fallback data until the refresher catches up. Failed critical
+# phases are retried in the background every STARTUP_RETRY_SECONDS, and the
+# worker becomes ready once they have all succeeded.
+STARTUP_RETRY_SECONDS = float(os.environ.get('STARTUP_RETRY_SECONDS', '5'))
+_startup_retry_task = None
+
+
+async def _startup_mongo():
+    await db.command("ping")
+
+
+async def _startup_indexes():
+    await ensure_history_collection()
+    await ensure_indexes()
+
+
+async def _startup_seed():
+    await seed_schemes()
+
+
+async def _startup_newsletter():
+    await start_newsletter_writer()
+
+
+async def _startup_market():
+    # The snapshot covers whatever is still fresh; anything missing or stale
+    # is fetched, and the warm-up waits for those fetches rather than for
+    # the request latency budget.
+    await load_cache_snapshot()
+    await asyncio.gather(fetch_top_coins(), trending_payload(), global_payload())
+    pending = [asyncio.shield(task) for key, task in _inflight.items() if key in _cache.namespaces]
+    await asyncio.gather(*pending, return_exceptions=True)
+
+
+def _startup_phase(run, timeout, critical):
+    name = run.__name__.removeprefix("_startup_")
+    return name, {
+        "run": run,
+        "timeout": float(os.environ.get(f"STARTUP_TIMEOUT_{name.upper()}", timeout)),
+        "critical": critical,
+    }
+
+
+STARTUP_PHASES = dict([
+    _startup_phase(_startup_mongo, 5.0, True),
+    _startup_phase(_startup_indexes, 10.0, True),
+    _startup_phase(_startup_seed, 10.0, True),
+    _startup_phase(_startup_newsletter, 10.0, True),
+    _startup_phase(_startup_market, 5.0, False),
+])
+_startup_state = {"ready": False, "seconds": None, "phases": {name: {"status": "pending"} for name in STARTUP_PHASES}}
+
+
+async def _run_startup_phase(name):
+    phase = STARTUP_PHASES[name]
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    try:
+        await asyncio.wait_for(phase["run"](), phase["timeout"])
+        status = "ok"
+    except asyncio.TimeoutError:
+        logging.warning(f"Startup phase {name} timed out after {phase['timeout']}s")
+        status = "timeout"
+    except Exception as e:
+        logging.error(f"Startup phase {name} failed: {e}")
+        status = "error"
+    seconds = round(loop.time() - started, 3)
+    _startup_state["phases"][name] = {"status": status, "seconds": seconds, "critical": phase["critical"]}
+    logging.info(f"Startup phase {name}: {status} in {seconds}s")
+    return status == "ok" or not phase["critical"]
+
+
+async def _retry_startup_phases(names):
+    while names:
+        await asyncio.sleep(STARTUP_RETRY_SECONDS)
+        results = await asyncio.gather(*[_run_startup_phase(name) for name in names])
+        names = [name for name, ok in zip(names, results) if not ok]
+    _startup_state["ready"] = True
+    logging.info("Startup phases recovered; worker is ready")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global _refresher_task, _snapshot_task, _loop_lag_task, _startup_retry_task
+    started = asyncio.get_running_loop().time()
+    _loop_lag_task = asyncio.create_task(_loop_lag_monitor())
+    get_http_client()
+    results = await asyncio.gather(*[_run_startup_phase(name) for name in STARTUP_PHASES])
+    _startup_state["seconds"] = round(asyncio.get_running_loop().time() - started, 3)
+    _startup_state["ready"] = all(results)
+    failed = [name for name, ok in zip(STARTUP_PHASES, results) if not ok]
+    if failed:
+        _startup_retry_task = asyncio.create_task(_retry_startup_phases(failed))
+    index_check = asyncio.create_task(verify_index_usage())
+    _background_tasks.add(index_check)
+    index_check.add_done_callback(_background_tasks.discard)
+    _refresher_task = asyncio.create_task(_refresh_loop())
+    _snapshot_task = asyncio.create_task(_snapshot_loop())
+    yield
+    # Stop advertising readiness first so load balancers drain this worker.
+    if _startup_retry_task is not None:
+        _startup_retry_task.cancel()
+    _startup_state["ready"] = False
+    _refresher_task.cancel()
+    _snapshot_task.cancel()
+    _loop_lag_task.cancel()
+    await save_cache_snapshot()
+    await stop_newsletter_writer()
+    client.close()
+    if http_client is not None:
+        await http_client.aclose()
+    await _shared_cache.close()
+
+
+@api_router.get("/health/ready")
+async def health_ready(response: Response):
+    if not _startup_state["ready"]:
+        response.status_code = 503
+    return _startup_state
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(api_router)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -379,11 +2865,8 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Cache-Status", "X-Cache-Age"],
 )
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
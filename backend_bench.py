@@ -0,0 +1,382 @@
+"""Offline load benchmark for the backend.
+
+Runs server.app under uvicorn against a local fake CoinGecko (with injectable
+latency, 429s and outages) and an in-memory Mongo (or a real one with
+--mongo-url), drives concurrent load at every /api route and reports req/s
+and p50/p95/p99 per route. Results are compared with the stored baseline and
+a run that regresses beyond --tolerance / --tail-tolerance exits non-zero.
+
+    python backend_bench.py                     # compare with the baseline
+    python backend_bench.py --save-baseline     # record a new baseline
+    python backend_bench.py --fault rate-limit  # 429s from the fake upstream
+
+The load generator, the app and the fake upstream share one event loop, so
+absolute numbers are lower than a deployed worker's; compare runs made on
+the same machine.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+import numpy as np
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+ROOT = Path(__file__).parent
+BASELINE_PATH = ROOT / "test_reports" / "benchmark_baseline.json"
+ADMIN_PASSWORD = "Newral@123"
+
+FAULTS = {
+    "none": {"latency": 0.05, "rate_limit": 0.0, "outage": False},
+    "slow": {"latency": 0.8, "rate_limit": 0.0, "outage": False},
+    "rate-limit": {"latency": 0.05, "rate_limit": 0.5, "outage": False},
+    "outage": {"latency": 0.05, "rate_limit": 0.0, "outage": True},
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeCoinGecko:
+    """The CoinGecko endpoints the backend calls, with deterministic data."""
+
+    def __init__(self, latency=0.05, rate_limit=0.0, outage=False, jitter=0.5, coins=250, seed=7):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.outage = outage
+        self.jitter = jitter
+        self.statuses = {}
+        rng = random.Random(seed)
+        self.coins = []
+        for i in range(coins):
+            price = round(rng.uniform(0.01, 60000) / (i + 1), 6)
+            self.coins.append({
+                "id": f"coin-{i}", "symbol": f"c{i}", "name": f"Coin {i}",
+                "image": f"https://example.invalid/{i}.png", "current_price": price,
+                "market_cap": int(price * 1e9 / (i + 1)), "market_cap_rank": i + 1,
+                "total_volume": int(price * 1e7), "price_change_percentage_24h": rng.uniform(-10, 10),
+                "sparkline_in_7d": {"price": [price * (1 + 0.05 * np.sin(j / 9 + i)) for j in range(168)]},
+            })
+        self.app = Starlette(routes=[
+            Route("/api/v3/coins/markets", self.markets),
+            Route("/api/v3/search/trending", self.trending),
+            Route("/api/v3/global", self.global_stats),
+            Route("/api/v3/simple/price", self.simple_price),
+            Route("/api/v3/exchange_rates", self.exchange_rates),
+        ])
+
+    async def _respond(self, payload):
+        await asyncio.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+        if self.outage:
+            response = JSONResponse({"error": "unavailable"}, status_code=503)
+        elif random.random() < self.rate_limit:
+            response = JSONResponse({"error": "rate limited"}, status_code=429, headers={"Retry-After": "1"})
+        else:
+            response = JSONResponse(payload)
+        self.statuses[response.status_code] = self.statuses.get(response.status_code, 0) + 1
+        return response
+
+    async def markets(self, request):
+        per_page = int(request.query_params.get("per_page", 100))
+        page = int(request.query_params.get("page", 1))
+        return await self._respond(self.coins[(page - 1) * per_page:page * per_page])
+
+    async def trending(self, request):
+        return await self._respond({"coins": [
+            {"item": {"id": c["id"], "name": c["name"], "symbol": c["symbol"], "thumb": c["image"],
+                      "market_cap_rank": c["market_cap_rank"], "price_btc": c["current_price"] / 60000}}
+            for c in self.coins[:15]
+        ]})
+
+    async def global_stats(self, request):
+        return await self._respond({"data": {
+            "total_market_cap": {"usd": 2.4e12}, "total_volume": {"usd": 9.1e10},
+            "market_cap_change_percentage_24h_usd": 1.2, "active_cryptocurrencies": 13000,
+            "markets": 1100, "market_cap_percentage": {"btc": 52.1},
+        }})
+
+    async def simple_price(self, request):
+        ids = request.query_params.get("ids", "").split(",")
+        by_id = {c["id"]: c for c in self.coins}
+        return await self._respond({i: {"usd": by_id[i]["current_price"]} for i in ids if i in by_id})
+
+    async def exchange_rates(self, request):
+        return await self._respond({"rates": {
+            "btc": {"name": "Bitcoin", "unit": "BTC", "value": 1.0, "type": "crypto"},
+            "usd": {"name": "US Dollar", "unit": "$", "value": 60000.0, "type": "fiat"},
+            "eur": {"name": "Euro", "unit": "€", "value": 55000.0, "type": "fiat"},
+            "inr": {"name": "Indian Rupee", "unit": "₹", "value": 5000000.0, "type": "fiat"},
+        }})
+
+
+class Workload:
+    """One call per /api route; each returns the HTTP status, or None when it has nothing left to do."""
+
+    def __init__(self, real_mongo):
+        self.real_mongo = real_mongo
+        self.emails = 0
+        self.scheme_ids = []
+
+    def _admin(self):
+        return {"x-admin-password": ADMIN_PASSWORD}
+
+    async def get(self, client, path, **kwargs):
+        return (await client.get(path, **kwargs)).status_code
+
+    async def create_scheme(self, client):
+        resp = await client.post("/api/admin/schemes", headers=self._admin(), json={
+            "title": "Bench Plan", "min_investment": 1000, "max_investment": 5000,
+            "return_percentage": 8.5, "duration_months": 6, "description": "benchmark", "is_active": False,
+        })
+        if resp.status_code == 200:
+            self.scheme_ids.append(resp.json()["id"])
+        return resp.status_code
+
+    async def update_scheme(self, client):
+        if not self.scheme_ids:
+            return None
+        resp = await client.put(f"/api/admin/schemes/{random.choice(self.scheme_ids)}", headers=self._admin(),
+                                json={"description": "benchmark update"})
+        return resp.status_code
+
+    async def delete_scheme(self, client):
+        if not self.scheme_ids:
+            return None
+        return (await client.delete(f"/api/admin/schemes/{self.scheme_ids.pop()}", headers=self._admin())).status_code
+
+    async def prices(self, client):
+        ids = ",".join(f"coin-{random.randrange(250)}" for _ in range(5))
+        return (await client.get(f"/api/crypto/price?ids={ids}")).status_code
+
+    async def subscribe(self, client):
+        self.emails += 1
+        resp = await client.post("/api/newsletter/subscribe", json={"email": f"bench{self.emails}@example.com"})
+        return resp.status_code
+
+    async def stream_first_event(self, client):
+        # Time to the first SSE event, then disconnect.
+        async with client.stream("GET", "/api/crypto/stream?limit=20") as resp:
+            async for line in resp.aiter_lines():
+                if line.startswith("data:"):
+                    break
+            return resp.status_code
+
+    def routes(self):
+        admin = {"headers": self._admin()}
+        routes = [
+            ("GET /", lambda c: self.get(c, "/api/")),
+            ("GET /health/ready", lambda c: self.get(c, "/api/health/ready")),
+            ("GET /schemes", lambda c: self.get(c, "/api/schemes")),
+            ("GET /settings", lambda c: self.get(c, "/api/settings")),
+            ("GET /team", lambda c: self.get(c, "/api/team")),
+            ("GET /crypto/top-coins", lambda c: self.get(c, "/api/crypto/top-coins?limit=20")),
+            ("GET /crypto/top-coins points", lambda c: self.get(c, "/api/crypto/top-coins?limit=100&points=30")),
+            ("GET /crypto/top-coins columnar", lambda c: self.get(c, "/api/crypto/top-coins?limit=100&format=columnar")),
+            ("GET /crypto/top-coins inr", lambda c: self.get(c, "/api/crypto/top-coins?limit=100&points=30&currency=inr")),
+            ("GET /crypto/trending", lambda c: self.get(c, "/api/crypto/trending")),
+            ("GET /crypto/global", lambda c: self.get(c, "/api/crypto/global")),
+            ("GET /crypto/price", self.prices),
+            ("GET /crypto/history", lambda c: self.get(c, "/api/crypto/history/coin-0?interval=1h")),
+            ("GET /crypto/stream", self.stream_first_event),
+            ("GET /bootstrap", lambda c: self.get(c, "/api/bootstrap?limit=20&points=30")),
+            ("POST /admin/login", lambda c: c.post("/api/admin/login", json={"password": ADMIN_PASSWORD})),
+            ("POST /admin/schemes", self.create_scheme),
+            ("PUT /admin/schemes/{id}", self.update_scheme),
+            ("DELETE /admin/schemes/{id}", self.delete_scheme),
+            ("PUT /admin/settings", lambda c: c.put("/api/admin/settings", json={"telegram_link": "https://t.me/bench"}, **admin)),
+            ("POST /newsletter/subscribe", self.subscribe),
+            ("GET /admin/stats", lambda c: self.get(c, "/api/admin/stats", **admin)),
+            ("GET /metrics", lambda c: self.get(c, "/api/metrics")),
+        ]
+        if self.real_mongo:
+            # explain() is not available on the in-memory stand-in.
+            routes.append(("GET /admin/indexes", lambda c: self.get(c, "/api/admin/indexes", **admin)))
+        return routes
+
+
+async def run_route(client, call, concurrency, duration):
+    latencies = []
+    statuses = {}
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration
+
+    async def worker():
+        while loop.time() < deadline:
+            started = time.perf_counter()
+            try:
+                status = await call(client)
+                if isinstance(status, httpx.Response):
+                    status = status.status_code
+            except Exception as e:
+                status = type(e).__name__
+            if status is None:
+                return
+            latencies.append(time.perf_counter() - started)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    if not latencies:
+        return {"requests": 0, "statuses": statuses}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    ok = sum(n for status, n in statuses.items() if status.isdigit() and int(status) < 400)
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "error_rate": round(1 - ok / len(latencies), 4),
+        "statuses": statuses,
+    }
+
+
+def compare(results, baseline, tolerance, tail_tolerance):
+    # Tails of a saturated single event loop are noisy, so p95 gets its own,
+    # looser tolerance than throughput and the median.
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before or not result.get("requests") or not before.get("requests"):
+            continue
+        for metric, allowed in (("p50_ms", tolerance), ("p95_ms", tail_tolerance)):
+            if result[metric] > before[metric] * (1 + allowed) and result[metric] - before[metric] > 1:
+                regressions.append(f"{name}: {metric[:3]} {before[metric]}ms -> {result[metric]}ms")
+        if result["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {before['rps']} -> {result['rps']} req/s")
+        if result["error_rate"] > before["error_rate"] + 0.01:
+            regressions.append(f"{name}: error rate {before['error_rate']:.2%} -> {result['error_rate']:.2%}")
+    return regressions
+
+
+def print_results(results):
+    print(f"\n{'route':<34}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}  statuses")
+    for name, r in results.items():
+        if not r.get("requests"):
+            print(f"{name:<34}{'-':>9}  no requests")
+            continue
+        print(f"{name:<34}{r['rps']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}{r['error_rate']:>8.1%}  {r['statuses']}")
+
+
+def configure_environment(args, upstream_port, workdir):
+    os.environ["COINGECKO_BASE"] = f"http://127.0.0.1:{upstream_port}/api/v3"
+    os.environ["MONGO_URL"] = args.mongo_url or "mongodb://127.0.0.1:27017"
+    os.environ["DB_NAME"] = args.db_name
+    os.environ["ADMIN_PASSWORD"] = ADMIN_PASSWORD
+    os.environ["UPSTREAM_HTTP2"] = "false"
+    os.environ["CACHE_BACKEND"] = "memory"
+    os.environ["CACHE_SNAPSHOT_PATH"] = str(workdir / "cache.snapshot")
+    os.environ["NEWSLETTER_JOURNAL_DIR"] = str(workdir / "journal")
+    sys.path.insert(0, str(ROOT / "backend"))
+    import server
+    if not args.mongo_url:
+        from mongomock_motor import AsyncMongoMockClient
+        server.client = AsyncMongoMockClient()
+        server.db = server.client[args.db_name]
+    return server
+
+
+async def serve(app, port):
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on")
+    uv = uvicorn.Server(config)
+    task = asyncio.create_task(uv.serve())
+    while not uv.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.02)
+    return uv, task
+
+
+async def main_async(args):
+    fake = FakeCoinGecko(**FAULTS[args.fault])
+    upstream_port, app_port = free_port(), free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        server = configure_environment(args, upstream_port, Path(workdir))
+        import logging
+        logging.getLogger().setLevel(logging.WARNING)
+        upstream_server, upstream_task = await serve(fake.app, upstream_port)
+        app_server, app_task = await serve(server.app, app_port)
+        results = {}
+        try:
+            limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{app_port}", limits=limits, timeout=30) as client:
+                workload = Workload(real_mongo=bool(args.mongo_url))
+                for name, call in workload.routes():
+                    if args.routes and not any(part in name for part in args.routes.split(",")):
+                        continue
+                    results[name] = await run_route(client, call, args.concurrency, args.duration)
+                    print(f"  {name}: {results[name].get('rps', 0)} req/s")
+        finally:
+            app_server.should_exit = True
+            await app_task
+            upstream_server.should_exit = True
+            await upstream_task
+    return results, fake.statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fault", choices=FAULTS, default="none", help="fault injected by the fake CoinGecko")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds of load per route")
+    parser.add_argument("--routes", help="comma-separated substrings selecting routes")
+    parser.add_argument("--mongo-url", help="real MongoDB to use instead of the in-memory stand-in")
+    parser.add_argument("--db-name", default="wealthx_bench")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed relative throughput/p50 regression")
+    parser.add_argument("--tail-tolerance", type=float, default=1.0, help="allowed relative p95 regression")
+    args = parser.parse_args()
+
+    print(f"🚀 Benchmarking every /api route: fault={args.fault}, concurrency={args.concurrency}, {args.duration}s each")
+    results, upstream_statuses = asyncio.run(main_async(args))
+    print_results(results)
+    print(f"\n🌐 Fake CoinGecko responses: {upstream_statuses}")
+
+    stored = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    key = f"{args.fault}/c{args.concurrency}"
+    if args.save_baseline:
+        # A run limited with --routes only replaces those routes' numbers.
+        routes = {**stored[key]["routes"], **results} if args.routes and key in stored else results
+        stored[key] = {
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "duration": args.duration,
+            "mongo": "real" if args.mongo_url else "in-memory",
+            "routes": routes,
+        }
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(stored, indent=2) + "\n")
+        print(f"💾 Baseline {key} saved to {args.baseline}")
+        return 0
+    if key not in stored:
+        print(f"⚠️  No baseline for {key}; run with --save-baseline to record one")
+        return 0
+    if stored[key]["duration"] != args.duration:
+        print(f"⚠️  Baseline {key} was recorded with {stored[key]['duration']}s per route; numbers may not be comparable")
+    regressions = compare(results, stored[key]["routes"], args.tolerance, args.tail_tolerance)
+    if regressions:
+        print(f"\n❌ Regressions against baseline {key}:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return 1
+    print(f"\n✅ No regressions against baseline {key}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
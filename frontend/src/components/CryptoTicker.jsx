@@ -10,15 +10,34 @@ export default function CryptoTicker() {
   useEffect(() => {
     const fetchCoins = async () => {
       try {
-        const res = await axios.get(`${API}/crypto/top-coins?limit=10`);
+        const res = await axios.get(`${API}/crypto/top-coins?limit=10&points=8`);
         setCoins(res.data.coins || []);
       } catch (err) {
         console.error("Ticker fetch error:", err);
       }
     };
-    fetchCoins();
-    const interval = setInterval(fetchCoins, 120000);
-    return () => clearInterval(interval);
+
+    // Prefer the server-pushed stream; fall back to polling if it is unavailable.
+    let interval = null;
+    let source = null;
+    const startPolling = () => {
+      if (interval) return;
+      fetchCoins();
+      interval = setInterval(fetchCoins, 120000);
+    };
+    if (typeof EventSource !== "undefined") {
+      source = new EventSource(`${API}/crypto/stream?limit=10&points=8`);
+      source.addEventListener("coins", (e) => setCoins(JSON.parse(e.data).coins || []));
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) startPolling();
+      };
+    } else {
+      startPolling();
+    }
+    return () => {
+      if (source) source.close();
+      if (interval) clearInterval(interval);
+    };
   }, []);
 
   if (coins.length === 0) return null;
@@ -63,14 +63,11 @@ export default function MarketPage() {
     else setLoading(true);
 
     try {
-      const [coinsRes, globalRes, trendingRes] = await Promise.all([
-        axios.get(`${API}/crypto/top-coins?limit=20`),
-        axios.get(`${API}/crypto/global`),
-        axios.get(`${API}/crypto/trending`),
-      ]);
-      setCoins(coinsRes.data.coins || []);
-      setGlobalStats(globalRes.data);
-      setTrending(trendingRes.data.trending || []);
+      const res = await axios.get(`${API}/bootstrap?sections=top_coins,global,trending&limit=20&points=30`);
+      const { top_coins, global, trending } = res.data.sections;
+      setCoins(top_coins.coins || []);
+      setGlobalStats(global);
+      setTrending(trending.trending || []);
     } catch (err) {
       console.error("Failed to fetch market data:", err);
     } finally {
@@ -82,7 +79,13 @@ export default function MarketPage() {
   useEffect(() => {
     fetchData();
     const interval = setInterval(() => fetchData(true), 120000);
-    return () => clearInterval(interval);
+    // Coin prices are pushed between the periodic refreshes.
+    const source = typeof EventSource !== "undefined" ? new EventSource(`${API}/crypto/stream?limit=20&points=30`) : null;
+    if (source) source.addEventListener("coins", (e) => setCoins(JSON.parse(e.data).coins || []));
+    return () => {
+      clearInterval(interval);
+      if (source) source.close();
+    };
   }, [fetchData]);
 
   return (
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "wealthx_test")
+os.environ.setdefault("CACHE_BACKEND", "memory")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+
+class FakeCoinGecko:
+    """Answers the CoinGecko endpoints the backend calls through httpx.MockTransport.
+
+    delays is consumed one entry per call (then delay applies), so a test can
+    make only the first call slow; status and headers replace every answer.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.delay = 0.0
+        self.delays = []
+        self.status = 200
+        self.headers = {}
+
+    def count(self, path):
+        return sum(1 for url in self.calls if url.path.endswith(path))
+
+    async def handle(self, request):
+        self.calls.append(request.url)
+        await asyncio.sleep(self.delays.pop(0) if self.delays else self.delay)
+        if self.status != 200:
+            return httpx.Response(self.status, headers=self.headers)
+        path = request.url.path
+        if path.endswith("/coins/markets"):
+            per_page = int(request.url.params.get("per_page", 20))
+            return httpx.Response(200, json=[
+                {"id": f"coin{i}", "name": f"Coin {i}", "symbol": f"c{i}", "image": "", "current_price": 1.0 + i,
+                 "market_cap": 1000 - i, "market_cap_rank": i + 1, "price_change_percentage_24h": 0.5,
+                 "total_volume": 10, "sparkline_in_7d": {"price": [float(j % 7) for j in range(168)]}}
+                for i in range(per_page)
+            ])
+        if path.endswith("/global"):
+            return httpx.Response(200, json={"data": {"total_market_cap": {"usd": 1}, "total_volume": {"usd": 1},
+                                                      "market_cap_percentage": {"btc": 50}}})
+        if path.endswith("/search/trending"):
+            return httpx.Response(200, json={"coins": []})
+        if path.endswith("/exchange_rates"):
+            return httpx.Response(200, json={"rates": {"usd": {"value": 100000.0}, "inr": {"value": 8300000.0}}})
+        if path.endswith("/simple/price"):
+            return httpx.Response(200, json={i: {"usd": 1.5} for i in request.url.params["ids"].split(",")})
+        return httpx.Response(404)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def coingecko(monkeypatch):
+    fake = FakeCoinGecko()
+    monkeypatch.setattr(server, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(fake.handle)))
+    return fake
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch, tmp_path):
+    # Module-level caches, schedulers and Mongo are swapped per test so tests
+    # neither see each other's state nor touch a real database or journal.
+    server._cache.clear()
+    server._inflight.clear()
+    server._inflight_throttled.clear()
+    server._refresh_targets.clear()
+    server._rendered.clear()
+    server._content_cache.clear()
+    server._content_versions.clear()
+    monkeypatch.setattr(server, "_rendered_bytes", 0)
+    monkeypatch.setattr(server, "_breakers", {})
+    monkeypatch.setattr(server, "upstream", server.UpstreamScheduler(rate_per_minute=600, burst=5))
+    monkeypatch.setattr(server, "price_batcher", server.PriceBatcher(server.PRICE_BATCH_WINDOW, server.PRICE_BATCH_MAX))
+    monkeypatch.setattr(server, "db", AsyncMongoMockClient()["wealthx_test"])
+    monkeypatch.setattr(server, "NEWSLETTER_JOURNAL_DIR", tmp_path / "journal")
+    monkeypatch.setattr(server, "_newsletter_emails", set())
+    monkeypatch.setattr(server, "_newsletter_pending", [])
+    monkeypatch.setattr(server, "_newsletter_unflushed", [])
+    monkeypatch.setattr(server, "_newsletter_journal", None)
+    monkeypatch.setattr(server, "_journal_written", 0)
+    monkeypatch.setattr(server, "_journal_synced", 0)
+    monkeypatch.setattr(server, "_journal_lock", asyncio.Lock())
+    monkeypatch.setattr(server, "_newsletter_flush_event", asyncio.Event())
+    monkeypatch.setattr(server, "_newsletter_task", None)
+    monkeypatch.setattr(server, "_newsletter_warmup", None)
+    monkeypatch.setattr(server, "_newsletter_claimed", False)
+    yield
+    if server._newsletter_journal is not None:
+        server._newsletter_journal.close()
+
+
+@pytest.fixture
+def api():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test")
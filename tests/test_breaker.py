@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+GLOBAL_URL = f"{server.COINGECKO_BASE}/global"
+
+
+async def fetch_global(**kwargs):
+    return await server.cached_fetch("global", GLOBAL_URL, ttl_seconds=300, **kwargs)
+
+
+async def test_breaker_opens_half_opens_and_closes():
+    breaker = server.CircuitBreaker("/global", failures=2, cooldown=0.05)
+    breaker.failed()
+    assert breaker.allow()
+    breaker.failed()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    await asyncio.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == "half-open"
+    breaker.failed()
+    assert breaker.state == "open"
+
+    await asyncio.sleep(0.06)
+    assert breaker.allow()
+    breaker.succeeded()
+    assert breaker.state == "closed"
+    assert breaker.counters == {"opened": 2, "half_opened": 2, "closed": 1, "rejected": 1, "failures": 3}
+
+
+async def test_open_breaker_answers_from_fallback_without_calling_upstream(coingecko):
+    server._breakers["/global"] = server.CircuitBreaker("/global", failures=2, cooldown=0.05)
+    coingecko.status = 503
+    for _ in range(2):
+        await fetch_global(fallback={"data": {}})
+    assert server._breakers["/global"].state == "open"
+    assert await fetch_global(fallback={"data": {}}) == {"data": {}}
+    assert coingecko.count("/global") == 2
+
+    await asyncio.sleep(0.06)
+    coingecko.status = 200
+    data = await fetch_global(fallback={"data": {}})
+    assert data["data"]["total_volume"] == {"usd": 1}
+    assert server._breakers["/global"].state == "closed"
+
+
+async def test_breakers_are_per_endpoint(coingecko):
+    assert server.breaker_for(GLOBAL_URL) is server.breaker_for(GLOBAL_URL + "?x=1")
+    assert server.breaker_for(GLOBAL_URL) is not server.breaker_for(f"{server.COINGECKO_BASE}/search/trending")
@@ -0,0 +1,76 @@
+from datetime import datetime, timezone
+
+import server
+
+
+def make_cache(max_bytes=10_000):
+    return server.BoundedCache(max_bytes, {
+        "top_coins": {"max_entries": 2, "max_age": 60},
+        "price:": {"max_entries": 3, "max_age": 60},
+    }, default_limit=5)
+
+
+def test_each_namespace_evicts_its_own_least_recently_used():
+    cache = make_cache()
+    cache.set("top_coins_usd_20", [1])
+    cache.set("top_coins_usd_50", [2])
+    cache.set("price:bitcoin", 1.0)
+    cache.get("top_coins_usd_20")
+    cache.set("top_coins_inr_20", [3])
+
+    assert "top_coins_usd_50" not in cache
+    assert "top_coins_usd_20" in cache and "top_coins_inr_20" in cache
+    # Filling one namespace never evicts another's entries.
+    assert "price:bitcoin" in cache
+    assert cache.counters["evictions"] == 1
+    assert cache.stats()["namespaces"]["top_coins"]["entries"] == 2
+
+
+def test_longest_prefix_picks_the_namespace():
+    cache = make_cache()
+    assert cache.namespace("price:bitcoin") == "price:"
+    assert cache.namespace("top_coins_usd_20") == "top_coins"
+    assert cache.namespace("unknown") == "default"
+
+
+def test_byte_budget_evicts_across_namespaces_oldest_first():
+    cache = make_cache(max_bytes=30)
+    cache.set("price:a", "x" * 8)
+    cache.set("top_coins_usd_20", "y" * 8)
+    cache.set("price:b", "z" * 8)
+    assert cache.bytes == 30
+
+    cache.set("price:c", "w" * 8)
+    assert "price:a" not in cache
+    assert cache.bytes == 30 and cache.bytes <= cache.max_bytes
+    assert cache.stats()["bytes"] == sum(e["size"] for e in cache.entries.values())
+
+
+def test_an_oversized_entry_is_still_kept_alone():
+    cache = make_cache(max_bytes=10)
+    cache.set("price:a", "x")
+    cache.set("price:big", "y" * 50)
+    assert list(cache.entries) == ["price:big"]
+
+
+def test_replacing_a_key_does_not_double_count_its_bytes():
+    cache = make_cache()
+    cache.set("price:a", "x" * 8)
+    cache.set("price:a", "x" * 18)
+    assert cache.bytes == 20
+    assert len(cache.lru["price:"]) == 1
+
+
+def test_entries_expire_by_namespace_max_age():
+    cache = make_cache()
+    old = datetime.now(timezone.utc).timestamp() - 120
+    cache.set("price:old", 1.0, ts=old)
+    cache.set("other", 1.0, ts=old)
+    assert cache.get("price:old") is None
+    assert cache.get("other") is not None
+    assert cache.counters["expirations"] == 1
+
+    cache.set("top_coins_usd_20", [1], ts=old)
+    cache.purge_expired()
+    assert "top_coins_usd_20" not in cache
+    assert cache.counters["expirations"] == 2
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+ADMIN = {"X-Admin-Password": server.ADMIN_PASSWORD}
+
+
+async def telegram_link(api):
+    response = await api.get("/api/settings")
+    return response.json().get("telegram_link")
+
+
+async def test_an_admin_write_is_served_at_once(api):
+    async with api:
+        before = await api.get("/api/settings")
+        response = await api.put("/api/admin/settings", json={"telegram_link": "https://t.me/new"}, headers=ADMIN)
+        assert response.status_code == 200
+        after = await api.get("/api/settings", headers={"If-None-Match": before.headers["etag"]})
+    assert after.status_code == 200
+    assert after.json()["telegram_link"] == "https://t.me/new"
+    assert await server.db.content_versions.find_one({"_id": "settings"}) is not None
+
+
+async def test_another_workers_write_is_seen_after_the_check_interval(api, monkeypatch):
+    monkeypatch.setattr(server, "CONTENT_VERSION_CHECK_SECONDS", 0.05)
+    async with api:
+        assert await telegram_link(api) == server.DEFAULT_SETTINGS["telegram_link"]
+
+        # Another worker writes straight to Mongo and bumps the group's version;
+        # nothing in this worker's memory is told.
+        await server.db.settings.insert_one({"id": "site_settings", "telegram_link": "https://t.me/other"})
+        await server.db.content_versions.update_one({"_id": "settings"}, {"$set": {"version": "other"}}, upsert=True)
+        assert await telegram_link(api) != "https://t.me/other"
+
+        await asyncio.sleep(0.06)
+        assert await telegram_link(api) == "https://t.me/other"
+
+
+async def test_read_through_loads_once_per_version():
+    loads = []
+
+    async def load():
+        loads.append(1)
+        return len(loads)
+
+    first = await server.read_through("thing", "things", load)
+    assert (await server.read_through("thing", "things", load)) is first
+    assert len(loads) == 1
+
+    await server.invalidate_content("things")
+    assert (await server.read_through("thing", "things", load))["data"] == 2
+    assert await server.content_version("things") != first["version"]
@@ -0,0 +1,53 @@
+import time
+
+import httpx
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_prices_are_scaled_from_the_usd_snapshot(coingecko, api):
+    async with api:
+        usd = (await api.get("/api/crypto/top-coins", params={"limit": 3})).json()["coins"]
+        inr = (await api.get("/api/crypto/top-coins", params={"limit": 3, "currency": "INR"})).json()["coins"]
+    assert coingecko.count("/coins/markets") == 1
+    assert inr[1]["current_price"] == pytest.approx(usd[1]["current_price"] * 83)
+    assert inr[1]["sparkline_in_7d"][:3] == pytest.approx([v * 83 for v in usd[1]["sparkline_in_7d"][:3]])
+
+
+async def test_unknown_currency_is_rejected(coingecko, api):
+    async with api:
+        response = await api.get("/api/crypto/top-coins", params={"currency": "xyz"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "currency must be one of inr, usd"
+
+
+async def test_rates_and_coins_are_fetched_concurrently(coingecko, api, monkeypatch):
+    events = []
+    handle = coingecko.handle
+
+    async def traced(request):
+        events.append(("start", request.url.path.rsplit("/", 1)[-1]))
+        response = await handle(request)
+        events.append(("end", request.url.path.rsplit("/", 1)[-1]))
+        return response
+
+    monkeypatch.setattr(server, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(traced)))
+    coingecko.delay = 0.05
+    async with api:
+        response = await api.get("/api/crypto/top-coins", params={"limit": 3, "currency": "inr"})
+    assert response.status_code == 200
+    assert sorted(events[:2]) == [("start", "exchange_rates"), ("start", "markets")]
+
+
+async def test_cold_rates_fail_fast_while_throttled(coingecko, api):
+    server.upstream.rate_limited(5)
+    async with api:
+        started = time.perf_counter()
+        response = await api.get("/api/crypto/top-coins", params={"currency": "inr"})
+    assert time.perf_counter() - started < 1
+    assert response.status_code == 503
+    assert response.json()["detail"] == "Exchange rates unavailable"
+    assert coingecko.calls == []
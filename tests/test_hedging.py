@@ -0,0 +1,39 @@
+import asyncio
+import time
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+GLOBAL_URL = f"{server.COINGECKO_BASE}/global"
+
+
+async def test_slow_call_is_hedged_and_the_faster_answer_wins(coingecko):
+    coingecko.delays = [1.0]
+    started = time.perf_counter()
+    data = await server._get_json(GLOBAL_URL, 5, hedge_after=0.05)
+    assert time.perf_counter() - started < 0.5
+    assert data["data"]["market_cap_percentage"] == {"btc": 50}
+    assert coingecko.count("/global") == 2
+    assert server.upstream.counters["hedged"] == 1
+
+
+async def test_background_calls_are_never_hedged(coingecko):
+    coingecko.delays = [0.1]
+    await server._get_json(GLOBAL_URL, 5, priority=server.UPSTREAM_BACKGROUND, hedge_after=0.01)
+    assert coingecko.count("/global") == 1
+    assert server.upstream.counters["hedged"] == 0
+
+
+async def test_request_over_its_budget_is_answered_and_the_fetch_fills_the_cache(coingecko, monkeypatch):
+    monkeypatch.setitem(server.LATENCY_SLOS["global"], "budget", 0.05)
+    coingecko.delay = 0.2
+    started = time.perf_counter()
+    fallback = {"data": {}}
+    assert await server.cached_fetch("global", GLOBAL_URL, ttl_seconds=300, fallback=fallback, slo="global") is fallback
+    assert time.perf_counter() - started < 0.15
+    assert server.upstream.counters["over_budget"] == 1
+    await asyncio.gather(*server._inflight.values())
+    assert server._cache.peek("global")["data"]["data"]["total_volume"] == {"usd": 1}
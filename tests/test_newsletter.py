@@ -0,0 +1,129 @@
+import asyncio
+import json
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def subscribe(api, email):
+    response = await api.post("/api/newsletter/subscribe", json={"email": email})
+    return response.json()["status"]
+
+
+async def test_subscriptions_are_journaled_then_written_behind(api):
+    async with api:
+        statuses = await asyncio.gather(*[subscribe(api, f"user{i}@example.com") for i in range(20)])
+        assert set(statuses) == {"success"}
+        assert await subscribe(api, "user3@example.com") == "exists"
+    assert await server.db.newsletter.count_documents({}) == 0
+    journal = server._journal_path().read_text().splitlines()
+    assert len(journal) == 20
+    assert server._journal_synced == server._journal_written == 20
+
+    await server.flush_newsletter()
+    assert await server.db.newsletter.count_documents({}) == 20
+    assert list(server.NEWSLETTER_JOURNAL_DIR.iterdir()) == []
+
+
+async def test_failed_batch_keeps_its_journal_until_retried(api, monkeypatch):
+    async with api:
+        await subscribe(api, "kept@example.com")
+
+    async def down(*args, **kwargs):
+        raise ConnectionError("mongo down")
+
+    # Collections are created per attribute access, so patch their class.
+    with monkeypatch.context() as patch:
+        patch.setattr(type(server.db.newsletter), "insert_many", down)
+        await server.flush_newsletter()
+        assert [p.suffix for p in server.NEWSLETTER_JOURNAL_DIR.iterdir()] == [".flushing"]
+
+    await server.flush_newsletter()
+    assert await server.db.newsletter.count_documents({"email": "kept@example.com"}) == 1
+    assert list(server.NEWSLETTER_JOURNAL_DIR.iterdir()) == []
+
+
+async def test_journal_of_a_dead_worker_is_replayed():
+    server.NEWSLETTER_JOURNAL_DIR.mkdir(parents=True)
+    orphan = server.NEWSLETTER_JOURNAL_DIR / "newsletter-999999999.jsonl"
+    docs = [{"id": str(i), "email": f"orphan{i}@example.com", "subscribed_at": "2024-01-01T00:00:00+00:00"}
+            for i in range(3)]
+    orphan.write_text("".join(json.dumps(doc) + "\n" for doc in docs))
+
+    server._claim_orphan_journals()
+    assert "orphan1@example.com" in server._newsletter_emails
+    await server.flush_newsletter()
+    assert await server.db.newsletter.count_documents({}) == 3
+    assert list(server.NEWSLETTER_JOURNAL_DIR.iterdir()) == []
+
+
+async def test_restarting_the_writer_does_not_claim_the_live_journal(api):
+    await server.db.newsletter.insert_one({"email": "known@example.com"})
+    await server.start_newsletter_writer()
+    async with api:
+        for i in range(3):
+            await subscribe(api, f"early{i}@example.com")
+        # A startup retry runs the phase again on a live worker.
+        await server.start_newsletter_writer()
+        await subscribe(api, "late@example.com")
+    await server.stop_newsletter_writer()
+    assert await server.db.newsletter.count_documents({}) == 5
+    assert "known@example.com" in server._newsletter_emails
+    assert list(server.NEWSLETTER_JOURNAL_DIR.iterdir()) == []
+
+
+async def test_failed_rotation_keeps_the_batch_pending(api, monkeypatch):
+    async with api:
+        await subscribe(api, "pending@example.com")
+
+    def no_rename(src, dst):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(server.os, "replace", no_rename)
+        with pytest.raises(OSError):
+            await server.flush_newsletter()
+    assert [doc["email"] for doc in server._newsletter_pending] == ["pending@example.com"]
+
+    await server.flush_newsletter()
+    assert await server.db.newsletter.count_documents({"email": "pending@example.com"}) == 1
+
+
+async def test_failed_fsync_still_queues_the_segment(api, monkeypatch):
+    async with api:
+        await subscribe(api, "synced@example.com")
+        server._journal_append({"id": "x", "email": "unsynced@example.com", "subscribed_at": ""})
+        server._newsletter_pending.append({"id": "x", "email": "unsynced@example.com", "subscribed_at": ""})
+
+    def no_fsync(fd):
+        raise OSError("I/O error")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(server.os, "fsync", no_fsync)
+        with pytest.raises(OSError):
+            await server.flush_newsletter()
+        with pytest.raises(OSError):
+            await server._journal_sync(server._journal_written)
+    await server.flush_newsletter()
+    assert await server.db.newsletter.count_documents({}) == 2
+    assert list(server.NEWSLETTER_JOURNAL_DIR.iterdir()) == []
+
+
+async def test_flusher_keeps_running_after_an_error(monkeypatch):
+    attempts = []
+
+    async def flaky_flush():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError("disk full")
+
+    monkeypatch.setattr(server, "NEWSLETTER_FLUSH_SECONDS", 0.01)
+    monkeypatch.setattr(server, "flush_newsletter", flaky_flush)
+    flusher = asyncio.ensure_future(server._newsletter_flusher())
+    await asyncio.sleep(0.1)
+    assert not flusher.done()
+    assert len(attempts) > 1
+    flusher.cancel()
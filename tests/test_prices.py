@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_concurrent_lookups_share_one_batch(coingecko, api):
+    async with api:
+        responses = await asyncio.gather(*[
+            api.get("/api/crypto/price", params={"ids": ids}) for ids in ("bitcoin,ethereum", "ethereum,solana", "solana")
+        ])
+    assert coingecko.count("/simple/price") == 1
+    assert responses[0].json() == {"prices": {"bitcoin": {"usd": 1.5}, "ethereum": {"usd": 1.5}}, "missing": []}
+    assert {r.headers["x-cache-status"] for r in responses} == {"fresh"}
+
+
+async def test_throttled_lookup_answers_at_once_and_fills_the_cache(coingecko, api):
+    server.upstream.rate_limited(0.2)
+    async with api:
+        started = time.perf_counter()
+        throttled = await api.get("/api/crypto/price", params={"ids": "bitcoin"})
+        assert time.perf_counter() - started < 0.15
+        await asyncio.sleep(0.3)
+        cached = await api.get("/api/crypto/price", params={"ids": "bitcoin"})
+    assert throttled.json() == {"prices": {}, "missing": ["bitcoin"]}
+    assert throttled.headers["x-cache-status"] == "fallback"
+    assert server.upstream.counters["throttled"] == 1
+    assert cached.json()["prices"] == {"bitcoin": {"usd": 1.5}}
+    assert coingecko.count("/simple/price") == 1
+
+
+async def test_stale_prices_are_served_while_throttled(coingecko, api):
+    async with api:
+        fresh = await api.get("/api/crypto/price", params={"ids": "bitcoin"})
+        server._cache.entries["price:bitcoin"]["ts"] -= server.PRICE_TTL + 1
+        server.upstream.rate_limited(5)
+        stale = await api.get("/api/crypto/price", params={"ids": "bitcoin"})
+    assert fresh.headers["x-cache-status"] == "fresh"
+    assert stale.json() == fresh.json()
+    assert stale.headers["x-cache-status"] == "stale"
+
+
+async def test_failed_batch_with_nothing_cached_is_a_fallback(coingecko, api):
+    coingecko.status = 500
+    async with api:
+        response = await api.get("/api/crypto/price", params={"ids": "bitcoin"})
+    assert response.json() == {"prices": {}, "missing": ["bitcoin"]}
+    assert response.headers["x-cache-status"] == "fallback"
+    assert server.price_batcher.counters["failures"] == 1
@@ -0,0 +1,43 @@
+import asyncio
+import logging
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def respond_after(delay, content_type=b"application/json"):
+    async def app(scope, receive, send):
+        await asyncio.sleep(delay)
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", content_type)]})
+        await asyncio.sleep(delay)
+        await send({"type": "http.response.body", "body": b"{}"})
+    return app
+
+
+async def call(app):
+    async def send(message):
+        pass
+    scope = {"type": "http", "method": "GET", "path": "/api/test", "headers": []}
+    await server.ProfilingMiddleware(app)(scope, None, send)
+
+
+async def test_slow_requests_are_timed_to_the_response_start(monkeypatch, caplog):
+    monkeypatch.setattr(server, "PROFILE_SLOW_SECONDS", 0.05)
+    with caplog.at_level(logging.INFO):
+        await call(respond_after(0.03))
+        assert caplog.records == []
+        await call(respond_after(0.06))
+    assert [r.levelno for r in caplog.records] == [logging.WARNING]
+    assert caplog.records[0].getMessage().startswith("Slow request GET /api/test")
+
+
+async def test_sampling_without_slow_capture_logs_at_info(monkeypatch, caplog):
+    monkeypatch.setattr(server, "PROFILE_SLOW_SECONDS", 0)
+    monkeypatch.setattr(server, "PROFILE_SAMPLE_RATE", 1.0)
+    with caplog.at_level(logging.INFO):
+        await call(respond_after(0))
+    assert [r.levelno for r in caplog.records] == [logging.INFO]
+    assert caplog.records[0].getMessage().startswith("Profiled request GET /api/test")
@@ -0,0 +1,73 @@
+import gzip
+
+import pytest
+from starlette.requests import Request
+
+import server
+
+PAYLOAD = {"coins": [{"id": f"coin{i}", "price": i * 1.5} for i in range(100)]}
+
+
+def request(**headers):
+    return Request({"type": "http", "method": "GET", "path": "/",
+                    "headers": [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]})
+
+
+def render(version="v1"):
+    return server.render_json("coins", version, lambda: PAYLOAD)
+
+
+def test_each_coding_gets_its_own_etag():
+    if server.brotli is None:
+        pytest.skip("brotli is optional")
+    rendered = render()
+    plain = server.json_response(request(), rendered)
+    br = server.json_response(request(accept_encoding="gzip, br"), rendered)
+    gz = server.json_response(request(accept_encoding="gzip, br;q=0"), rendered)
+
+    assert plain.headers["etag"] == rendered["etag"]
+    assert br.headers["etag"] == rendered["etag"][:-1] + '-br"'
+    assert gz.headers["etag"] == rendered["etag"][:-1] + '-gzip"'
+    assert server.brotli.decompress(br.body) == gzip.decompress(gz.body) == plain.body
+    assert plain.headers["vary"] == "Accept-Encoding"
+
+
+def test_small_bodies_are_not_compressed():
+    rendered = server.render_json("tiny", "v1", lambda: {"ok": True})
+    response = server.json_response(request(accept_encoding="br"), rendered)
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == rendered["etag"]
+
+
+def test_any_coding_tag_revalidates_with_304():
+    rendered = render()
+    tag = server.json_response(request(accept_encoding="br"), rendered).headers["etag"]
+
+    for header in (tag, rendered["etag"], "W/" + tag, f'"other", {tag}', "*"):
+        response = server.json_response(request(accept_encoding="gzip", if_none_match=header), rendered)
+        assert response.status_code == 304, header
+        assert response.body == b""
+        # The 304 carries the tag of the coding this request would get.
+        assert response.headers["etag"].endswith('-gzip"')
+
+    stale = server.json_response(request(if_none_match='"other"'), rendered)
+    assert stale.status_code == 200
+
+
+def test_renders_are_reused_per_version():
+    built = []
+
+    def build():
+        built.append(1)
+        return PAYLOAD
+
+    first = server.render_json("coins", "v1", build)
+    assert server.render_json("coins", "v1", build) is first
+    assert server.render_json("coins", "v2", build) is not first
+    assert len(built) == 2
+
+
+def test_unversioned_renders_share_an_etag_for_equal_bodies():
+    first = server.render_json("history", None, lambda: PAYLOAD)
+    second = server.render_json("history", None, lambda: dict(PAYLOAD))
+    assert first is second
@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+GLOBAL_URL = f"{server.COINGECKO_BASE}/global"
+
+
+async def fetch_global(**kwargs):
+    return await server.cached_fetch("global", GLOBAL_URL, ttl_seconds=300, **kwargs)
+
+
+# --- Rate limits ---
+async def test_429_pauses_the_bucket_for_retry_after(coingecko):
+    coingecko.status = 429
+    coingecko.headers = {"Retry-After": "5"}
+    started = time.perf_counter()
+    assert await fetch_global(fallback={"data": {}}, slo="global") == {"data": {}}
+    assert time.perf_counter() - started < 1
+    assert server.upstream.counters["rate_limited"] == 1
+    assert server.upstream.stats()["blocked_for"] == pytest.approx(5, abs=0.5)
+
+
+async def test_handlers_answer_without_waiting_out_a_pause(coingecko, api):
+    server.upstream.rate_limited(5)
+    async with api:
+        started = time.perf_counter()
+        responses = await asyncio.gather(
+            api.get("/api/crypto/global"),
+            api.get("/api/crypto/trending"),
+            api.get("/api/crypto/top-coins"),
+        )
+        elapsed = time.perf_counter() - started
+    assert elapsed < 1
+    assert {r.headers["x-cache-status"] for r in responses} == {"fallback"}
+    assert coingecko.calls == []
+    assert server.upstream.counters["throttled"] == 3
+
+
+# --- Token bucket ---
+async def test_waiting_requests_are_served_before_background_refreshes():
+    bucket = server.UpstreamScheduler(rate_per_minute=600, burst=1)
+    await bucket.acquire(server.UPSTREAM_USER)
+    assert not bucket.ready()
+    order = []
+
+    async def take(priority, name):
+        await bucket.acquire(priority)
+        order.append(name)
+
+    background = asyncio.ensure_future(take(server.UPSTREAM_BACKGROUND, "background"))
+    await asyncio.sleep(0)
+    user = asyncio.ensure_future(take(server.UPSTREAM_USER, "user"))
+    await asyncio.gather(background, user)
+    assert order == ["user", "background"]
+    assert bucket.counters["queued"] == 2
+
+
+async def test_cancelled_waiter_gives_up_its_place():
+    bucket = server.UpstreamScheduler(rate_per_minute=600, burst=1)
+    await bucket.acquire(server.UPSTREAM_USER)
+    waiter = asyncio.ensure_future(bucket.acquire(server.UPSTREAM_USER))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    await asyncio.wait_for(bucket.acquire(server.UPSTREAM_USER), 1)
+    assert bucket.stats()["waiting"] == 0
+
+
+# --- Stale-while-revalidate ---
+async def test_revalidation_runs_at_background_priority(coingecko, monkeypatch):
+    priorities = []
+    download = server._download
+
+    async def recording(spec, priority, throttled=None):
+        priorities.append(priority)
+        return await download(spec, priority, throttled)
+
+    monkeypatch.setattr(server, "_download", recording)
+    server._cache.set("global", {"data": {"cached": True}}, ts=time.time() - 301)
+    stale = await fetch_global(policy="global", slo="global")
+    assert stale == {"data": {"cached": True}}
+    await asyncio.gather(*server._inflight.values())
+    assert priorities == [server.UPSTREAM_BACKGROUND]
+    assert server.upstream.counters["hedged"] == 0
@@ -0,0 +1,138 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeRedis:
+    """Dict-backed stand-in for the async Redis calls RedisBackend makes."""
+
+    def __init__(self):
+        self.values = {}
+        self.expires = {}
+
+    def _live(self, key):
+        if key in self.expires and self.expires[key] <= time.monotonic():
+            self.values.pop(key, None)
+            self.expires.pop(key, None)
+        return self.values.get(key)
+
+    async def get(self, key):
+        return self._live(key)
+
+    async def set(self, key, value, nx=False, px=None, ex=None):
+        if nx and self._live(key) is not None:
+            return None
+        self.values[key] = value.encode() if isinstance(value, str) else value
+        self.expires.pop(key, None)
+        if px is not None or ex is not None:
+            self.expires[key] = time.monotonic() + (px / 1000 if px is not None else ex)
+        return True
+
+    async def eval(self, script, numkeys, *args):
+        assert script == server.RedisBackend.RELEASE_SCRIPT and numkeys == 1
+        key, token = args
+        if self._live(key) == token.encode():
+            del self.values[key]
+            self.expires.pop(key, None)
+            return 1
+        return 0
+
+    async def aclose(self):
+        pass
+
+
+@pytest.fixture(params=["file", "redis"])
+def backend(request, tmp_path):
+    if request.param == "file":
+        return server.FileBackend(tmp_path / "cache")
+    return server.RedisBackend(FakeRedis())
+
+
+def entry(data, age=0.0):
+    return {"data": data, "ts": datetime.now(timezone.utc).timestamp() - age}
+
+
+async def test_entries_round_trip_and_expire(backend):
+    await backend.set("global", entry({"n": 1}), 60)
+    assert (await backend.get("global"))["data"] == {"n": 1}
+    assert await backend.get("missing") is None
+
+    await backend.set("old", entry({"n": 2}, age=120), 60)
+    if backend.name == "redis":
+        # Redis expires by its own clock; age the stand-in's key instead.
+        backend.redis.expires[backend.prefix + "old"] = time.monotonic()
+    assert await backend.get("old") is None
+
+
+async def test_lease_is_exclusive_until_released(backend):
+    token = await backend.acquire("global", 30)
+    assert token is not None
+    assert await backend.acquire("global", 30) is None
+    assert await backend.acquire("trending", 30) is not None
+
+    await backend.release("global", token)
+    assert await backend.acquire("global", 30) is not None
+    await backend.close()
+
+
+async def test_a_stale_token_cannot_release_a_newer_lease(backend):
+    stale = await backend.acquire("global", 30)
+    await backend.release("global", stale)
+    current = await backend.acquire("global", 30)
+    # The first holder releasing again must not free the second one's lease.
+    await backend.release("global", stale)
+    assert await backend.acquire("global", 30) is None
+    await backend.release("global", current)
+    await backend.close()
+
+
+async def test_an_expired_redis_lease_is_taken_over_and_kept():
+    backend = server.RedisBackend(FakeRedis())
+    first = await backend.acquire("global", 0.01)
+    await asyncio.sleep(0.02)
+    second = await backend.acquire("global", 30)
+    assert second is not None
+    await backend.release("global", first)
+    assert await backend.acquire("global", 30) is None
+
+
+async def test_file_leases_exclude_other_workers(tmp_path):
+    # Each worker opens its own lease file handles, as separate processes do.
+    one, two = server.FileBackend(tmp_path), server.FileBackend(tmp_path)
+    assert await one.acquire("global", 30) is not None
+    assert await two.acquire("global", 30) is None
+    await one.close()
+    assert await two.acquire("global", 30) is not None
+    await two.close()
+
+
+async def test_fresh_shared_entry_is_adopted_without_going_upstream(backend, coingecko, monkeypatch):
+    monkeypatch.setattr(server, "_shared_cache", backend)
+    await backend.set("global", entry({"data": {"market_cap_percentage": {"btc": 61}}}), 300)
+
+    payload = await server.global_payload()
+    assert payload["btc_dominance"] == 61
+    assert coingecko.count("/global") == 0
+    assert server._cache.peek("global") is not None
+
+
+async def test_waiter_adopts_what_the_lease_holder_publishes(backend, coingecko, monkeypatch):
+    monkeypatch.setattr(server, "_shared_cache", backend)
+    monkeypatch.setattr(server, "SHARED_POLL_SECONDS", 0.01)
+    holder = server.RedisBackend(backend.redis) if backend.name == "redis" else server.FileBackend(backend.directory)
+    token = await holder.acquire("global", 30)
+
+    async def other_worker():
+        await asyncio.sleep(0.05)
+        await holder.set("global", entry({"data": {"market_cap_percentage": {"btc": 42}}}), 300)
+        await holder.release("global", token)
+
+    payload, _ = await asyncio.gather(server.global_payload(), other_worker())
+    assert payload["btc_dominance"] == 42
+    assert coingecko.count("/global") == 0
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+GLOBAL_URL = f"{server.COINGECKO_BASE}/global"
+
+
+async def fetch_global(**kwargs):
+    return await server.cached_fetch("global", GLOBAL_URL, ttl_seconds=300, **kwargs)
+
+
+# --- Single-flight ---
+async def test_concurrent_misses_share_one_upstream_call(coingecko):
+    coingecko.delay = 0.05
+    results = await asyncio.gather(*[fetch_global() for _ in range(20)])
+    assert coingecko.count("/global") == 1
+    assert all(result == results[0] for result in results)
+    assert server._inflight == {}
+
+
+async def test_shared_failure_reaches_every_waiter_and_clears_the_slot(coingecko):
+    coingecko.status = 500
+    results = await asyncio.gather(*[fetch_global() for _ in range(5)], return_exceptions=True)
+    assert coingecko.count("/global") == 1
+    assert all(isinstance(result, Exception) for result in results)
+    assert server._inflight == {}
+
+    fallback = {"data": {}}
+    assert await fetch_global(fallback=fallback) is fallback
+    assert coingecko.count("/global") == 2
+
+
+async def test_cancelled_waiter_does_not_abort_the_shared_fetch(coingecko):
+    coingecko.delay = 0.1
+    cancelled = asyncio.ensure_future(fetch_global())
+    kept = asyncio.ensure_future(fetch_global())
+    await asyncio.sleep(0.02)
+    cancelled.cancel()
+    data = await kept
+    assert data["data"]["market_cap_percentage"] == {"btc": 50}
+    assert cancelled.cancelled()
+    assert coingecko.count("/global") == 1
+    assert server._inflight == {}
+    assert server._cache.peek("global")["data"] == data
@@ -0,0 +1,62 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def snapshot_path(monkeypatch, tmp_path):
+    path = tmp_path / "snapshot" / "cache.snapshot"
+    monkeypatch.setattr(server, "CACHE_SNAPSHOT_PATH", path)
+    monkeypatch.setattr(server, "_snapshot_marker", None)
+    return path
+
+
+async def test_a_restart_keeps_entries_and_their_timestamps(snapshot_path):
+    now = datetime.now(timezone.utc).timestamp()
+    server._cache.set("global", {"data": {"btc": 50}}, ts=now - 100)
+    server._cache.set("price:bitcoin", {"usd": 1.5}, ts=now - 5)
+    await server.save_cache_snapshot()
+    assert snapshot_path.exists()
+
+    server._cache.clear()
+    assert await server.load_cache_snapshot() == 2
+    assert server._cache.peek("global")["data"] == {"data": {"btc": 50}}
+    assert server._cache.peek("global")["ts"] == now - 100
+    assert server._cache.peek("price:bitcoin")["ts"] == now - 5
+
+
+async def test_entries_past_max_age_and_newer_local_ones_are_skipped():
+    now = datetime.now(timezone.utc).timestamp()
+    server._cache.set("global", {"old": True}, ts=now - server._cache.max_age("global") - 10)
+    server._cache.set("trending", {"coins": ["snapshot"]}, ts=now - 10)
+    await server.save_cache_snapshot()
+
+    server._cache.clear()
+    server._cache.set("trending", {"coins": ["live"]}, ts=now)
+    assert await server.load_cache_snapshot() == 0
+    assert "global" not in server._cache
+    assert server._cache.peek("trending")["data"] == {"coins": ["live"]}
+
+
+async def test_an_unchanged_cache_is_not_rewritten(snapshot_path):
+    server._cache.set("global", {"n": 1})
+    await server.save_cache_snapshot()
+    snapshot_path.write_bytes(b"sentinel")
+    await server.save_cache_snapshot()
+    assert snapshot_path.read_bytes() == b"sentinel"
+
+    server._cache.set("global", {"n": 2})
+    await server.save_cache_snapshot()
+    assert snapshot_path.read_bytes() != b"sentinel"
+
+
+async def test_missing_or_corrupt_snapshots_load_nothing(snapshot_path):
+    assert await server.load_cache_snapshot() == 0
+    snapshot_path.parent.mkdir(parents=True)
+    snapshot_path.write_bytes(b"not a snapshot")
+    assert await server.load_cache_snapshot() == 0
+    assert len(server._cache.entries) == 0
@@ -0,0 +1,78 @@
+import base64
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def series(rows=3, n=168):
+    rng = np.random.default_rng(7)
+    return np.cumsum(rng.normal(size=(rows, n)), axis=1) + 100
+
+
+def test_lttb_keeps_the_endpoints_and_the_extremes():
+    raw = series()
+    raw[1, 80] = 500.0
+    sampled = server.lttb(raw, 30)
+    assert sampled.shape == (3, 30)
+    assert (sampled[:, 0] == raw[:, 0]).all() and (sampled[:, -1] == raw[:, -1]).all()
+    assert 500.0 in sampled[1]
+    # Each row is picked independently, in time order.
+    for row, picked in zip(raw, sampled):
+        positions = [int(np.flatnonzero(row == value)[0]) for value in picked]
+        assert positions == sorted(positions)
+
+
+def test_lttb_leaves_short_series_alone():
+    raw = series(n=20)
+    assert server.lttb(raw, 30) is raw
+    assert server.lttb(raw, 2) is raw
+
+
+def test_delta_encoding_round_trips_within_one_step():
+    values = series(rows=1)[0]
+    encoded = server._encode_sparkline(values, "delta")
+    decoded = encoded["base"] + encoded["scale"] * np.cumsum(encoded["deltas"])
+    assert np.abs(decoded - values).max() <= encoded["scale"] / 2 + 1e-9
+    assert all(isinstance(d, int) for d in encoded["deltas"])
+
+
+def test_delta_encoding_of_a_flat_series():
+    encoded = server._encode_sparkline(np.full(10, 3.0), "delta")
+    assert encoded == {"base": 3.0, "scale": 1.0, "deltas": [0] * 10}
+
+
+def test_f32_encoding_round_trips():
+    values = series(rows=1)[0]
+    decoded = np.frombuffer(base64.b64decode(server._encode_sparkline(values, "f32")), dtype="<f4")
+    assert np.allclose(decoded, values, rtol=1e-6)
+
+
+def test_points_snap_up_to_a_resolution():
+    assert server.sparkline_options(None, "json") == (None, "json")
+    assert server.sparkline_options(1, "delta") == (8, "delta")
+    assert server.sparkline_options(30, "json") == (30, "json")
+    assert server.sparkline_options(31, "json") == (60, "json")
+    assert server.sparkline_options(500, "f32") == (None, "f32")
+
+
+@pytest.mark.parametrize("points", [0, -3])
+def test_non_positive_points_are_rejected(points):
+    with pytest.raises(HTTPException) as raised:
+        server.sparkline_options(points, "json")
+    assert raised.value.status_code == 400
+
+
+async def test_top_coins_rejects_bad_sparkline_options(api, coingecko):
+    async with api:
+        assert (await api.get("/api/crypto/top-coins?points=-3")).status_code == 400
+        assert (await api.get("/api/crypto/top-coins?encoding=png")).status_code == 400
+        response = await api.get("/api/crypto/top-coins?limit=5&points=10&encoding=delta")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["sparkline"] == {"points": 16, "encoding": "delta"}
+    assert len(body["coins"][0]["sparkline_in_7d"]["deltas"]) == 16
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def phases(monkeypatch, tmp_path):
+    # Stand-in phases: each entry in failures makes the phase fail once more.
+    failures = {"mongo": 0, "market": 0}
+    ran = []
+
+    def phase(name, critical, timeout=1.0):
+        async def run():
+            ran.append(name)
+            if failures[name]:
+                failures[name] -= 1
+                raise ConnectionError(f"{name} down")
+        return {"run": run, "timeout": timeout, "critical": critical}
+
+    monkeypatch.setattr(server, "STARTUP_PHASES", {"mongo": phase("mongo", True), "market": phase("market", False)})
+    monkeypatch.setattr(server, "_startup_state", {"ready": False, "seconds": None, "phases": {}})
+    monkeypatch.setattr(server, "STARTUP_RETRY_SECONDS", 0.01)
+    monkeypatch.setattr(server, "CACHE_SNAPSHOT_PATH", tmp_path / "cache.snapshot")
+    return failures, ran
+
+
+async def ready(api):
+    response = await api.get("/api/health/ready")
+    return response.status_code, response.json()
+
+
+async def test_not_ready_until_startup_has_run(api, phases):
+    async with api:
+        status, body = await ready(api)
+    assert status == 503 and body["ready"] is False
+
+
+async def test_a_failed_critical_phase_is_retried_until_ready(api, coingecko, phases):
+    failures, ran = phases
+    failures["mongo"] = 2
+    async with server.lifespan(server.app), api:
+        status, body = await ready(api)
+        assert status == 503
+        assert body["phases"]["mongo"]["status"] == "error"
+
+        for _ in range(100):
+            if server._startup_state["ready"]:
+                break
+            await asyncio.sleep(0.01)
+        status, body = await ready(api)
+    assert status == 200
+    assert body["phases"]["mongo"]["status"] == "ok"
+    # Only the failed phase is retried.
+    assert ran.count("mongo") == 3 and ran.count("market") == 1
+
+
+async def test_a_failed_optional_phase_does_not_block_readiness(api, coingecko, phases):
+    failures, _ = phases
+    failures["market"] = 1
+    async with server.lifespan(server.app), api:
+        status, body = await ready(api)
+        assert status == 200
+        assert body["phases"]["market"]["status"] == "error"
+        assert body["phases"]["market"]["critical"] is False
+    # Shutdown stops advertising readiness.
+    assert server._startup_state["ready"] is False
+
+
+async def test_an_overrun_phase_times_out(phases, monkeypatch):
+    async def hang():
+        await asyncio.sleep(10)
+
+    monkeypatch.setitem(server.STARTUP_PHASES, "mongo", {"run": hang, "timeout": 0.01, "critical": True})
+    assert await server._run_startup_phase("mongo") is False
+    assert server._startup_state["phases"]["mongo"]["status"] == "timeout"